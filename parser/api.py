@@ -0,0 +1,136 @@
+"""Compile Jack sources in memory, without touching the filesystem.
+
+    result = compile_source("class Main { ... }")
+    result.output  # the xml, as a string
+    result.diagnostics  # [Diagnostic, ...], they unpack as (line number, message)
+
+`compile_stream()` does the same but writes the output to a stream as it
+is parsed, for sources too big to hold in memory, and `check_source()` only
+checks the syntax, without making any output.
+"""
+import io
+
+from parser.jack_tokenizer import JackTokenizer
+from parser.compilation_engine import CompilationEngine
+from parser.iterative_engine import IterativeCompilationEngine
+from parser.ll1_engine import LL1CompilationEngine
+from parser.emitters import Emitter, XmlEmitter, JsonLinesEmitter, BinaryEmitter
+from parser.diagnostics import Diagnostic
+from parser.utils.exceptions import CompileError
+
+# output format: (file extension, open mode, emitter class)
+OUTPUT_FORMATS = {
+    'xml': ('.test.xml', 'w', XmlEmitter),
+    'json': ('.test.jsonl', 'w', JsonLinesEmitter),
+    'binary': ('.test.jkb', 'wb', BinaryEmitter),
+}
+
+ENGINES = {
+    'recursive': CompilationEngine,
+    'iterative': IterativeCompilationEngine,
+    'll1': LL1CompilationEngine,
+}
+
+
+class CompileResult:
+    """The outcome of compiling one class.
+
+    `output` is the str (or bytes, for the binary format) output, None if it
+    was written to a stream. `diagnostics` are the `Diagnostic` of the
+    syntax error, if any, then of every semantic error. `error` is the
+    `CompileError` that stopped the parse, None if it completed.
+    """
+
+    def __init__(self, output, diagnostics, error):
+        self.output = output
+        self.diagnostics = diagnostics
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return "<{} ok={} diagnostics={}>".format(self.__class__.__name__, self.ok, len(self.diagnostics))
+
+
+def compile_source(source, output_format='xml', engine='recursive', checks=(), limits=None, chunk_size=None):
+    """Compile a class from a str, bytes (utf-8) or readable file-like object.
+
+    :returns: a `CompileResult` holding the whole output.
+    """
+
+    mode = OUTPUT_FORMATS[output_format][1]
+    out_f = io.BytesIO() if 'b' in mode else io.StringIO()
+    result = compile_stream(source, out_f, output_format, engine, checks, limits, chunk_size)
+    result.output = out_f.getvalue()
+    return result
+
+
+def check_source(source, engine='recursive', checks=(), limits=None, chunk_size=None):
+    """Check the syntax of a class (and `checks`) without making any output.
+
+    :returns: a `CompileResult` without output, whose `diagnostics` are
+        empty if the class is fine.
+    """
+
+    return compile_stream(source, None, engine=engine, checks=checks, limits=limits, chunk_size=chunk_size)
+
+
+def compile_stream(source, outfile, output_format='xml', engine='recursive', checks=(), limits=None,
+                   chunk_size=None):
+    """Compile a class, writing its output to `outfile` as it is parsed.
+
+    `source` is as for `compile_source()`, a file-like one is read in chunks
+    of `chunk_size` characters if given. `outfile` is a text or binary
+    stream (text formats are written to binary ones as utf-8), an
+    `Emitter`, in which case `output_format` is not used, or None for no
+    output at all.
+    Neither stream is closed. A source that ends before its class does is
+    a syntax error like any other, reported in the result's diagnostics.
+
+    :returns: a `CompileResult` without output.
+    """
+
+    if isinstance(source, str):
+        source = io.StringIO(source)
+
+    wrapper = None
+    if outfile is None or isinstance(outfile, Emitter):
+        emitter = outfile
+    else:
+        _, mode, emitter_class = OUTPUT_FORMATS[output_format]
+        if 'b' not in mode and isinstance(outfile, (io.RawIOBase, io.BufferedIOBase)):
+            outfile = wrapper = io.TextIOWrapper(outfile, encoding='utf-8', write_through=True)
+        emitter = emitter_class(outfile)
+
+    jt = JackTokenizer(source, chunk_size, limits=limits)
+    ce = ENGINES[engine](jt, emitter, checks)
+    diagnostics = []
+    error = None
+    try:
+        ce.compile_class()
+    except CompileError as ex:
+        error = ex
+        diagnostics.append(Diagnostic.from_error(ex, jt))
+    finally:
+        if wrapper is not None:
+            wrapper.detach()  # leave the caller's stream open.
+    diagnostics.extend(Diagnostic.from_semantic_error(*error) for error in ce.semantic_errors)
+    return CompileResult(None, diagnostics, error)
+
+
+if __name__ == "__main__":
+    import sys
+
+    # a truncated class is a diagnostic of every engine, from a str or read in chunks.
+    for truncated in ('class A { function void f() { return; }', 'class A {', 'class', ''):
+        for engine in ENGINES:
+            for chunk_size in (None, 4):
+                result = compile_source(io.StringIO(truncated), engine=engine, chunk_size=chunk_size)
+                assert not result.ok and len(result.diagnostics) == 1, (truncated, engine, result.diagnostics)
+                assert isinstance(result.error, CompileError), (truncated, engine, result.error)
+                result = check_source(truncated, engine=engine)
+                assert not result.ok and len(result.diagnostics) == 1, (truncated, engine, result.diagnostics)
+
+    print("ok", file=sys.stderr)
@@ -0,0 +1,148 @@
+"""Read Jack sources from, and write outputs to, zip and tar(.gz) archives.
+
+Members are streamed straight into the tokenizer and outputs straight into
+the output archive, nothing is extracted to disk.
+"""
+import io
+import os
+import posixpath
+import tarfile
+import threading
+import time
+import zipfile
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz')
+
+
+def is_archive(path):
+    return path.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def safe_member_name(name):
+    """`name` normalized, None if it is absolute or climbs out of the archive with '..'."""
+    name = posixpath.normpath(name.replace('\\', '/'))
+    if name.startswith('/') or name == '..' or name.startswith('../') or ':' in name.partition('/')[0]:
+        return None
+    return name
+
+
+def archive_sources(path, suffix='.jack'):
+    """Yield the (member name, binary stream) of every `suffix` file of an archive, in archive order.
+
+    A tar is read in a single pass, without seeking, so each stream is only
+    valid until the next member is asked for, when it is closed. Members
+    with unsafe names (see `safe_member_name()`) are skipped.
+    """
+    if path.lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                name = safe_member_name(info.filename)
+                if name is not None and not info.is_dir() and name.endswith(suffix):
+                    with archive.open(info) as member_f:
+                        yield name, member_f
+    else:
+        with tarfile.open(path, 'r|*') as archive:
+            for info in archive:
+                name = safe_member_name(info.name)
+                if name is not None and info.isfile() and name.endswith(suffix):
+                    with archive.extractfile(info) as member_f:
+                        yield name, member_f
+
+
+class OutputArchive:
+    """Writes outputs as the members of a .zip or .tar(.gz) archive instead of files.
+
+    It has the `outputs()` of an `OutputCommitter`, so whatever writes
+    through one can write to an archive instead. Members are named by the
+    path of their output relative to `root`. The archive is built in a temp
+    file, renamed to `path` by `close()`, or on leaving a with block. It is
+    deleted by `abort()` instead, or if the block raised, so an interrupted
+    run never leaves a truncated archive or replaces a complete one.
+    Outputs may be added from several threads at once.
+    """
+
+    def __init__(self, path, root=''):
+        self.path = path
+        self.root = root
+        self.written = 0
+        self._temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        self._lock = threading.Lock()
+        if path.lower().endswith('.zip'):
+            self._archive = zipfile.ZipFile(self._temp_path, 'w', zipfile.ZIP_DEFLATED)
+        elif is_archive(path):
+            self._archive = tarfile.open(self._temp_path, 'w:gz' if path.lower().endswith('gz') else 'w')
+        else:
+            raise ValueError("{} is not a .zip, .tar, .tar.gz or .tgz file".format(path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def outputs(self):
+        """The outputs of one source, see `ArchiveOutputSet`."""
+        return ArchiveOutputSet(self)
+
+    def add(self, path, data):
+        """Add the bytes `data` as the member for the output `path`."""
+        name = os.path.relpath(path, self.root or os.curdir).replace(os.sep, '/')
+        with self._lock:
+            if isinstance(self._archive, zipfile.ZipFile):
+                self._archive.writestr(name, data)
+            else:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = time.time()
+                self._archive.addfile(info, io.BytesIO(data))
+            self.written += 1
+
+    def close(self):
+        with self._lock:
+            if self._archive is None:
+                return
+            self._archive.close()
+            self._archive = None
+            os.replace(self._temp_path, self.path)
+
+    def abort(self):
+        """Delete the archive built so far, leaving `path` as it was."""
+        with self._lock:
+            if self._archive is None:
+                return
+            self._archive.close()
+            self._archive = None
+            os.unlink(self._temp_path)
+
+
+class ArchiveOutputSet:
+    """The outputs of one source for an `OutputArchive`, added together or not at all.
+
+    Files `open()`ed are buffered in memory, on leaving the with block they
+    are added to the archive, unless the block raised or `discard()` was called.
+    """
+
+    def __init__(self, archive):
+        self._archive = archive
+        self._files = []  # (buffer, path)
+        self._discarded = False
+
+    def open(self, path, mode='w'):
+        out_f = io.BytesIO() if 'b' in mode else io.StringIO()
+        self._files.append((out_f, path))
+        return out_f
+
+    def discard(self):
+        self._discarded = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None and not self._discarded:
+            for out_f, path in self._files:
+                output = out_f.getvalue()
+                self._archive.add(path, output.encode('utf-8') if isinstance(output, str) else output)
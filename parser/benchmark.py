@@ -0,0 +1,199 @@
+"""Benchmark the compile path and gate on regressions against a saved baseline.
+
+A run compiles a set of sources `trials` times and records, per trial, the
+seconds spent in each phase: 'tokenize' (the tokenizer alone, draining every
+token), 'compile' (tokenizer, engine and emitter together) and 'engine'
+(compile less tokenize, ie: what the engine and emitter add). The peak
+memory of one compile is measured with tracemalloc in a separate pass, so
+its overhead does not skew the times.
+
+Baselines are json files holding the raw trial times, so a later run can be
+compared with a rank test (Mann-Whitney U) rather than with two averages.
+A phase regresses when its median is more than `threshold` slower than the
+baseline's and the test says the slowdown is not noise.
+"""
+import gc
+import io
+import json
+import math
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+from parser.api import compile_source
+from parser.jack_tokenizer import JackTokenizer
+
+BASELINE_VERSION = 1  # bumped when the layout of baseline files changes.
+TRIALS = 15
+WARM_UP_TRIALS = 2
+THRESHOLD = 0.05  # relative slowdown (or memory growth) tolerated before failing.
+ALPHA = 0.01  # significance level of the rank test.
+
+PHASES = ('tokenize', 'engine', 'compile')
+
+
+def environment():
+    """What a baseline was measured on, runs on another machine are not comparable."""
+    try:
+        import numpy
+    except ImportError:  # pragma: no cover - numpy is optional
+        numpy = None
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'platform': sys.platform,
+        'numpy': numpy.__version__ if numpy is not None else None,
+    }
+
+
+def tokenize_all(sources, chunk_size):
+    """Read every token of the sources, as the engine would."""
+    for source in sources:
+        jt = JackTokenizer(io.StringIO(source), chunk_size)
+        while jt.has_more_tokens():
+            jt.advance()
+            jt.token_type()
+
+
+def compile_all(sources, engine, chunk_size):
+    for source in sources:
+        compile_source(source, engine=engine, chunk_size=chunk_size)
+
+
+def timed(function, *args):
+    gc.collect()
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def run(sources, engine='recursive', chunk_size=None, trials=TRIALS, warm_up=WARM_UP_TRIALS):
+    """Benchmark compiling `sources`, a list of source texts.
+
+    :returns: a result dict, as saved by `save()`.
+    """
+
+    for _ in range(warm_up):
+        compile_all(sources, engine, chunk_size)
+
+    samples = {phase: [] for phase in PHASES}
+    for _ in range(trials):
+        tokenize = timed(tokenize_all, sources, chunk_size)
+        total = timed(compile_all, sources, engine, chunk_size)
+        samples['tokenize'].append(tokenize)
+        samples['compile'].append(total)
+        samples['engine'].append(max(total - tokenize, 0.0))
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        compile_all(sources, engine, chunk_size)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    source_bytes = sum(len(source.encode()) for source in sources)
+    return {
+        'version': BASELINE_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'environment': environment(),
+        'config': {'engine': engine, 'chunk_size': chunk_size, 'files': len(sources), 'bytes': source_bytes},
+        'samples': samples,
+        'peak_memory': peak_memory,
+        'throughput': source_bytes / statistics.median(samples['compile']),
+    }
+
+
+def save(result, path):
+    with open(path, 'w') as baseline_f:
+        json.dump(result, baseline_f, indent=1)
+
+
+def load(path):
+    with open(path) as baseline_f:
+        baseline = json.load(baseline_f)
+    if baseline.get('version') != BASELINE_VERSION:
+        raise ValueError("{} is a version {} baseline, expected version {}".format(
+            path, baseline.get('version'), BASELINE_VERSION))
+    return baseline
+
+
+def mann_whitney_greater(current, baseline):
+    """One-sided Mann-Whitney U test that `current` tends to be larger than `baseline`.
+
+    Uses the normal approximation with tie and continuity corrections, good
+    enough from about 8 samples each.
+
+    :returns: the p-value.
+    """
+
+    n1, n2 = len(current), len(baseline)
+    values = sorted([(value, 0) for value in current] + [(value, 1) for value in baseline])
+    rank_sum = 0.0
+    ties = 0.0
+    index = 0
+    while index < len(values):
+        end = index
+        while end + 1 < len(values) and values[end + 1][0] == values[index][0]:
+            end += 1
+        average_rank = (index + end) / 2 + 1
+        rank_sum += average_rank * sum(1 for value in values[index:end + 1] if value[1] == 0)
+        tied = end - index + 1
+        ties += tied ** 3 - tied
+        index = end + 1
+
+    n = n1 + n2
+    u = rank_sum - n1 * (n1 + 1) / 2
+    variance = n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (u - n1 * n2 / 2 - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def compare(current, baseline, threshold=THRESHOLD, alpha=ALPHA):
+    """Compare a run with a baseline, phase by phase.
+
+    :returns: a list of (metric, baseline value, current value, relative
+        change, p-value or None, regressed) rows.
+    """
+
+    rows = []
+    for phase in PHASES:
+        before = statistics.median(baseline['samples'][phase])
+        after = statistics.median(current['samples'][phase])
+        change = after / before - 1 if before else 0.0
+        p_value = mann_whitney_greater(current['samples'][phase], baseline['samples'][phase])
+        rows.append((phase, before, after, change, p_value, change > threshold and p_value < alpha))
+
+    before, after = baseline['peak_memory'], current['peak_memory']
+    change = after / before - 1 if before else 0.0
+    rows.append(('peak_memory', before, after, change, None, change > threshold))
+    return rows
+
+
+def report(rows, current, baseline):
+    """A table of the comparison, naming the phases that regressed."""
+    lines = []
+    if current['environment'] != baseline['environment']:
+        lines.append("warning: the baseline was measured on {}".format(baseline['environment']))
+    if current['config'] != baseline['config']:
+        lines.append("warning: the baseline was measured with {}".format(baseline['config']))
+
+    lines.append("{:<12} {:>12} {:>12} {:>9} {:>9}  {}".format('metric', 'baseline', 'current', 'change', 'p', ''))
+    for metric, before, after, change, p_value, regressed in rows:
+        if metric == 'peak_memory':
+            before, after = "{:.1f}MiB".format(before / 2 ** 20), "{:.1f}MiB".format(after / 2 ** 20)
+        else:
+            before, after = "{:.2f}ms".format(before * 1000), "{:.2f}ms".format(after * 1000)
+        lines.append("{:<12} {:>12} {:>12} {:>+8.1f}% {:>9}  {}".format(
+            metric, before, after, change * 100, '-' if p_value is None else "{:.4f}".format(p_value),
+            'REGRESSED' if regressed else ''))
+    lines.append("throughput: {:.0f} -> {:.0f} bytes/s".format(baseline['throughput'], current['throughput']))
+
+    regressed = [row[0] for row in rows if row[5]]
+    lines.append("Regressed: {}".format(', '.join(regressed)) if regressed else "No regression")
+    return '\n'.join(lines)
@@ -1,5 +1,8 @@
+import types
+
+from parser.emitters import Emitter, XmlEmitter, NullEmitter
 from parser.utils import token_types
-from parser.utils.fancy_objects import PlusEqualsableIterator
+from parser.utils.fancy_objects import PlusEqualsableIterator, DiscardingIterator
 from parser.utils.exceptions import (
     CompileError,
     CompileKeywordError,
@@ -19,8 +22,20 @@ from parser.utils.exceptions import (
     CompileReturnError,
     CompileIfError,
     CompileWhileError,
+    OneOf,
 )
 
+# Semantic checks that can be turned on, see `CompilationEngine.__init__`.
+CONSTRUCTOR_RETURN = 'constructor_return'
+BOOLEAN_CONDITION = 'boolean_condition'
+INT_OPERAND = 'int_operand'
+OS_CALLS = 'os_calls'
+SEMANTIC_CHECKS = (CONSTRUCTOR_RETURN, BOOLEAN_CONDITION, INT_OPERAND, OS_CALLS)
+
+# types an int or a boolean may be given as, None is an unknown type.
+INT_TYPES = (None, 'int', 'char')
+BOOLEAN_TYPES = (None, 'boolean')
+
 
 class CompilationEngine:
     """A recursive top-down parser for Jack.
@@ -50,52 +65,151 @@ class CompilationEngine:
 
     """
 
-    def __init__(self, infile, outfile):
+    ARITHMETIC_OPS = frozenset({'+', '-', '*', '/'})
+    COMPARISON_OPS = frozenset({'&lt;', '&gt;'})  # as escaped by the tokenizer.
+    OPS = ('+', '-', '*', '/', '&amp;', '|', '&lt;', '&gt;', '=')  # as escaped by the tokenizer.
+    UNARY_OPS = ('-', '~')
+    KEYWORD_CONSTANTS = ('true', 'false', 'null', 'this')
+
+    # the tokens `add_type()` accepts, for diagnostics.
+    TYPE_TOKENS = ('int', 'char', 'boolean', 'identifier')
+    RETURN_TYPE_TOKENS = TYPE_TOKENS + ('void',)
+
+    KEYWORD_CONSTANT_TYPES = types.MappingProxyType({
+        token_types.TRUE: 'boolean',
+        token_types.FALSE: 'boolean',
+        token_types.THIS: 'this',
+    })
+
+    def __init__(self, infile, outfile, checks=(), outline=False):
         """Creates a new compilation engine with the given input and output.
 
+        `outfile` is either an `Emitter` or a stream to write xml to.
+        Use a `FanOutEmitter` to feed one parse into several emitters.
+        None (or a `NullEmitter`) only checks the syntax: terminals are not
+        even buffered and nothing is written.
+
+        `checks` turns on any of the `SEMANTIC_CHECKS`. They are done during
+        the parse, using the type each `compile_expression()` and `compile_term()`
+        returns, and don't stop it. Failures are collected in `semantic_errors`
+        as (line number, message). `OS_CALLS` checks the arity and kind of
+        calls of the Jack OS against the table of `parser.os_api`, only
+        imported when it is on.
+
+        With `outline` only declarations are parsed: every subroutineBody
+        is skipped by matching its braces and left out of the output, so a
+        subroutineDec ends with its ')'. Checks need the bodies, so they
+        can't be combined with it.
+
+        Resource limits are given to the tokenizer, the engine enforces
+        their nesting depth through `infile.governor`.
+
         The next routine called must be `compile_class()`.
         """
+        if checks and outline:
+            raise ValueError("Semantic checks need subroutine bodies, they can't be done in outline mode.")
 
         # I'm kind of confused about piping ...
         self._infile = infile
-        self._outfile = outfile
-        self._indent = 0
-        self._body = PlusEqualsableIterator()  # iterator of all body elements.
+        self._set_output(outfile)
+        self.checks = frozenset(checks)
+        self._os_subroutines = {}
+        if OS_CALLS in self.checks:
+            from parser.os_api import OS_SUBROUTINES
+            self._os_subroutines = OS_SUBROUTINES
+        self.outline = outline
+        self._start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the tokenizer, and so the source if it opened it. Safe to call again."""
+        self._infile.close()
+
+    def reset(self, source, outfile=None):
+        """Get ready to compile another class, read from `source` by the same tokenizer.
+
+        `source` is as for `JackTokenizer.reset()`, `outfile` as for
+        `__init__()`, replacing the output if given. Checks and options are
+        kept, the class, its symbols and `semantic_errors` start over, so one
+        tokenizer and engine can compile many files.
+
+        The next routine called must be `compile_class()`.
+        """
+        self._infile.reset(source)
+        if outfile is not None:
+            self._set_output(outfile)
+        self._start()
+
+    def _set_output(self, outfile):
+        if outfile is None:
+            outfile = NullEmitter()
+        self._emitter = outfile if isinstance(outfile, Emitter) else XmlEmitter(outfile)
+        if isinstance(self._emitter, NullEmitter):
+            self.write_body = self._write_nothing
+        else:
+            vars(self).pop('write_body', None)
+
+    def _start(self):
+        """Forget the class compiled last, if any."""
+        self._governor = getattr(self._infile, 'governor', None)
+        # iterator of all body elements.
+        self._body = DiscardingIterator() if isinstance(self._emitter, NullEmitter) else PlusEqualsableIterator()
         self._safe_to_step = True
+        self.semantic_errors = []
+        self._class_name = None
+        self._class_symbols = {}  # variable name: type name
+        self._subroutine_name = None
+        self._subroutine_kind = None
+        self._subroutine_symbols = {}
 
     def compile_class(self):
         """Compiles a complete class.
 
         class: 'class' className '{' classVarDec* subroutineDec* '}'
+
+        A resource limit that was exceeded is raised as its own
+        `CompileLimitError`, even if the parse caught it on the way.
         """
         current_element = 'class'
 
-        self.add_keywords([current_element])  # step 1 - 'class'
-        self.add_identifier('class name')  # step 2 - className
-        self.add_symbols(['{'])  # step 3 - '{'
+        try:
+            self.add_keywords([current_element])  # step 1 - 'class'
+            self._class_name = self.add_identifier('class name')  # step 2 - className
+            self.add_symbols(['{'])  # step 3 - '{'
 
-        # write start of element body
-        self.write_non_terminal_start(current_element)
+            # write start of element body
+            self.write_non_terminal_start(current_element)
 
-        while True:  # step 4 - classVarDec*
-            try:
-                self.compile_class_var_dec()  # step 4.i - classVarDec
-            except CompileKeywordError:
-                break
+            while True:  # step 4 - classVarDec*
+                try:
+                    self.compile_class_var_dec()  # step 4.i - classVarDec
+                except CompileKeywordError:
+                    break
 
-        # This compile has a dead first step!
-        while True:  # step 5 - subroutineDec*
-            try:
-                self.compile_subroutine()  # step 5.i - subroutineDec
-            except CompileKeywordError:
-                break
+            # This compile has a dead first step!
+            while True:  # step 5 - subroutineDec*
+                try:
+                    self.compile_subroutine()  # step 5.i - subroutineDec
+                except CompileKeywordError:
+                    break
 
-        # Since the previous function stepped ahead on fail ...
-        # don't step here.
-        self.add_symbols(['}'])  # step 6 - '}'
+            # Since the previous function stepped ahead on fail ...
+            # don't step here.
+            self.add_symbols(['}'])  # step 6 - '}'
 
-        # write end of element body
-        self.write_non_terminal_end(current_element)
+            # write end of element body
+            self.write_non_terminal_end(current_element)
+        except CompileError:
+            if self._governor is not None and self._governor.error is not None:
+                raise self._governor.error
+            raise
+        if self._governor is not None and self._governor.error is not None:
+            raise self._governor.error
 
     def compile_class_var_dec(self):
         """Compiles a static declaration or a field declaration.
@@ -105,9 +219,9 @@ class CompilationEngine:
 
         self.add_keywords(['static', 'field'])  # step 1 - ('static' | 'field)
         try:
-            self.add_type_var_name_var_name()  # step 2-5 - type varName (, varName)* ';'
+            self.add_type_var_name_var_name(self._class_symbols)  # step 2-5 - type varName (, varName)* ';'
         except CompileError as ex:
-            raise CompileClassVarDecError("Expected a complete static  or a field declaration: " + str(ex))
+            raise CompileClassVarDecError("Expected a complete static  or a field declaration") from ex
 
         # write element body
         self.write_non_terminal("classVarDec")
@@ -124,11 +238,12 @@ class CompilationEngine:
         current_element = "subroutineDec"
 
         # Previous call stepped ahead and extra time so don't step here.
-        self.add_keywords(['constructor', 'function', 'method'])
+        self._subroutine_kind = self.add_keywords(['constructor', 'function', 'method'])
+        self._subroutine_symbols = {}
 
         try:
             self.add_type(void=True)
-            self.add_identifier('subroutine name')
+            self._subroutine_name = self.add_identifier('subroutine name')
             self.add_symbols(['('])
 
             self.write_non_terminal_start(current_element)  # write body start
@@ -140,9 +255,12 @@ class CompilationEngine:
             self.add_symbols([')'])
             self.write_body()
 
-            self.compile_subroutine_body()
+            if self.outline:
+                self.skip_subroutine_body()
+            else:
+                self.compile_subroutine_body()
         except CompileError as ex:
-            raise CompileSubroutineError("Expected a complete method, function or constructor declaration: " + str(ex))
+            raise CompileSubroutineError("Expected a complete method, function or constructor declaration") from ex
 
         self.write_non_terminal_end(current_element)  # write body end
 
@@ -154,16 +272,16 @@ class CompilationEngine:
 
         while True:
             try:
-                self.add_type()  # step 1 - type
+                type_ = self.add_type()  # step 1 - type
             except CompileTypeError:
                 break
 
             # If first case passes this one has to exist
             # This is the only real step to error check on.
             try:
-                self.add_identifier('variable name')  # step 2 - varName
+                self._subroutine_symbols[self.add_identifier('variable name')] = type_  # step 2 - varName
             except CompileError as ex:
-                raise CompileParameterListError("Expected a complete parameter list declaration: " + str(ex))
+                raise CompileParameterListError("Expected a complete parameter list declaration") from ex
             try:
                 self.add_symbols([','])
             except CompileSymbolError:
@@ -179,9 +297,9 @@ class CompilationEngine:
 
         self.add_keywords(['var'])
         try:
-            self.add_type_var_name_var_name()
+            self.add_type_var_name_var_name(self._subroutine_symbols)
         except CompileError as ex:
-            raise CompileVarDecError("Expected a complete variable declaration: " + str(ex))
+            raise CompileVarDecError("Expected a complete variable declaration") from ex
         self.write_non_terminal('varDec')
 
     def compile_subroutine_body(self):
@@ -205,9 +323,36 @@ class CompilationEngine:
 
             self.add_symbols(['}'])
         except CompileError as ex:
-            raise CompileSubroutineBodyError("Expected a complete subroutine body declaration: " + str(ex))
+            raise CompileSubroutineBodyError("Expected a complete subroutine body declaration") from ex
         self.write_non_terminal_end(current_element)
 
+    def skip_subroutine_body(self):
+        """Skips a subroutine body by matching its braces over the raw tokens.
+
+        Nothing inside the body is parsed or output.
+        """
+
+        f = self._infile
+
+        if self._safe_to_step:
+            f.advance()
+            self._safe_to_step = False
+
+        try:
+            if f.token != '{':
+                raise CompileSymbolError("Expected {}", OneOf(['{']), expected=['{'])
+
+            depth = 1
+            while depth:
+                f.advance()  # at the end of input it raises, as the statements of a full parse would.
+                if f.token == '{':
+                    depth += 1
+                elif f.token == '}':
+                    depth -= 1
+        except CompileError as ex:
+            raise CompileSubroutineBodyError("Expected a complete subroutine body declaration") from ex
+        self._safe_to_step = True
+
     def compile_statements(self):
         """Compiles a sequence of statements, not including the enclosing '{ }'.
 
@@ -237,7 +382,7 @@ class CompilationEngine:
             elif f.key_word() == token_types.RETURN:
                 self.compile_return()
             else:
-                raise CompileKeywordError("Expected let | if | while | do | return")
+                raise CompileKeywordError("Expected let | if | while | do | return", first='_statement')
             if self._safe_to_step:
                 f.advance()
                 self._safe_to_step = False
@@ -260,7 +405,7 @@ class CompilationEngine:
             self.add_subroutine_call()
             self.add_symbols([';'])
         except CompileError as ex:
-            raise CompileDoError("Expected a complete do statement: " + str(ex))
+            raise CompileDoError("Expected a complete do statement") from ex
         self.write_non_terminal_end(current_element)
 
     def compile_let(self):
@@ -286,7 +431,7 @@ class CompilationEngine:
 
             # These should run as long as the previous step passes!
             if expression:
-                self.compile_expression()
+                self.check(INT_OPERAND, self.compile_expression() in INT_TYPES, "an int value is expected")
                 self.add_symbols([']'])
 
             self.add_symbols(['='])  # requires special write method
@@ -295,7 +440,7 @@ class CompilationEngine:
             self.compile_expression()
             self.add_symbols([';'])
         except CompileError as ex:
-            raise CompileLetError("Expected a complete let statement: " + str(ex))
+            raise CompileLetError("Expected a complete let statement") from ex
 
         self.write_non_terminal_end(current_element)
 
@@ -311,14 +456,14 @@ class CompilationEngine:
             self.add_keywords(['while'])
             self.add_symbols(['('])
             self.write_non_terminal_start(current_element)
-            self.compile_expression()
+            self.check(BOOLEAN_CONDITION, self.compile_expression() in BOOLEAN_TYPES, "a boolean value is expected")
             self.add_symbols([')'])
             self.add_symbols(['{'])
             self.write_body()
             self.compile_statements()
             self.add_symbols(['}'])
         except CompileError as ex:
-            raise CompileWhileError("Exprected a complete while statement: " + str(ex))
+            raise CompileWhileError("Exprected a complete while statement") from ex
 
         self.write_non_terminal_end(current_element)
 
@@ -334,16 +479,20 @@ class CompilationEngine:
             self.add_keywords(['return'])
             self.write_non_terminal_start(current_element)
 
+            type_ = None
             try:
                 self.add_symbols([';'])  # if next element is ';', just move on.
             except CompileSymbolError:  # if it wasn't it should be an expression
                 try:
-                    self.compile_expression()  # optional expression
+                    type_ = self.compile_expression()  # optional expression
                 except CompileExpressionError:
                     pass
                 self.add_symbols([';'])  # followed by a ';'
+
+            if self._subroutine_kind == token_types.CONSTRUCTOR:
+                self.check(CONSTRUCTOR_RETURN, type_ == 'this', "A constructor must return 'this'")
         except CompileError as ex:
-            raise CompileReturnError("Expected a complete return statement: " + str(ex))
+            raise CompileReturnError("Expected a complete return statement") from ex
         self.write_non_terminal_end(current_element)
 
     def compile_if(self):
@@ -360,7 +509,7 @@ class CompilationEngine:
             self.add_symbols(['('])
             self.write_non_terminal_start(current_element)
 
-            self.compile_expression()
+            self.check(BOOLEAN_CONDITION, self.compile_expression() in BOOLEAN_TYPES, "a boolean value is expected")
             self.add_symbols([')'])
             self.add_symbols(['{'])
             self.write_body()
@@ -377,7 +526,7 @@ class CompilationEngine:
                 self.compile_statements()
                 self.add_symbols(['}'])
         except CompileError as ex:
-            raise CompileIfError("Expected a complete if statement: " + str(ex))
+            raise CompileIfError("Expected a complete if statement") from ex
 
         self.write_non_terminal_end(current_element)
 
@@ -385,24 +534,35 @@ class CompilationEngine:
         """Compiles an `expression`.
 
         term (op term)*
+
+        :returns: the type name of the expression, None if it is unknown.
         """
 
         current_element = "expression"
         self.write_non_terminal_start(current_element)
 
         try:
-            self.compile_term()
+            type_ = self.compile_term()
 
             while True:
                 try:
-                    self.add_op_or_unary_op()
+                    op = self.add_op_or_unary_op()
                     self.write_body()
-                    self.compile_term()
+                    right_type = self.compile_term()
                 except CompileOpError:
                     break  # no (op term)* exists!
+
+                if op in self.ARITHMETIC_OPS or op in self.COMPARISON_OPS:
+                    self.check(INT_OPERAND, type_ in INT_TYPES and right_type in INT_TYPES, "an int value is expected")
+                    type_ = 'int' if op in self.ARITHMETIC_OPS else 'boolean'
+                elif op == '=':
+                    type_ = 'boolean'
+                elif type_ != right_type:  # '&' | '|' are bitwise for ints and logical for booleans.
+                    type_ = None
         except CompileError as ex:
-            raise CompileExpressionError("Expected a complete expression: " + str(ex))
+            raise CompileExpressionError("Expected a complete expression") from ex
         self.write_non_terminal_end(current_element)
+        return type_
 
     def compile_term(self):
         """Compiles a `term`.
@@ -410,6 +570,9 @@ class CompilationEngine:
         This routine is faced with a slight difficulty when trying to decide between some of the alternative parsing rules. Specifically, if the current token is an identifier, the routine must distinguish between a variable, an array entry, and a subroutine call. A single look-ahead token, which may be one of "[", "{" or "." suffices to distinguish between the three possibilities. Any other token is not part of this term and should not be advanced over.
 
         term: integerConstant | stringConstant | keywordConstant | varName | varName '[' expression ']' | subroutineCall | '(' expression ')' | unaryOp term
+
+        :returns: the type name of the term, None if it is unknown.
+            The keyword constant `this` has type 'this'.
         """
         f = self._infile
         current_element = "term"
@@ -419,52 +582,65 @@ class CompilationEngine:
             f.advance()
             self._safe_to_step = False
 
+        type_ = None
         if f.token_type() == token_types.INT_CONST:
             self._body += ['integerConstant', f.int_val()]
             self._safe_to_step = True
+            type_ = 'int'
         elif f.token_type() == token_types.STRING_CONST:
             self._body += ['stringConstant', f.string_val()]
             self._safe_to_step = True
+            type_ = 'String'
         elif f.token_type() == token_types.KEYWORD:
-            self.add_keyword_constant()
+            type_ = self.KEYWORD_CONSTANT_TYPES.get(self.add_keyword_constant())
         elif f.token_type() == token_types.IDENTIFIER:
-            self.add_identifier('variable name | subroutine name | class name')
+            name = self.add_identifier('variable name | subroutine name | class name')
             f.advance()
             self._safe_to_step = False
+            type_ = self._subroutine_symbols.get(name) or self._class_symbols.get(name)
             if f.token_type() == token_types.SYMBOL:
                 if f.symbol() == '[':
+                    type_ = None  # array elements are untyped.
                     self.add_symbols(['['])  # requires special write
                     self.write_body()
-                    self.compile_expression()
+                    self.check(INT_OPERAND, self.compile_expression() in INT_TYPES, "an int value is expected")
                     self.add_symbols([']'])
                 elif f.symbol() == '(':
+                    type_ = None
                     self.add_symbols(['('])  # requires special write
                     self.write_body()
                     self.compile_expression_list()
                     self.add_symbols([')'])
                 elif f.symbol() == '.':
+                    type_ = None
                     self.add_symbols(['.'])
                     self.write_body()
-                    self.add_subroutine_call()
+                    self.add_subroutine_call(name)
         elif f.token_type() == token_types.SYMBOL:
             if f.symbol() == '(':
                 self.add_symbols(['('])  # requires special write
                 self.write_body()
-                self.compile_expression()
+                type_ = self.compile_expression()
                 self.add_symbols([')'])
             elif f.symbol() in ['-', '~']:
-                self.add_op_or_unary_op(unary=True)  # requires special write
+                op = self.add_op_or_unary_op(unary=True)  # requires special write
                 self.write_body()
-                self.compile_term()
+                type_ = self.compile_term()
+                if op == '-':
+                    self.check(INT_OPERAND, type_ in INT_TYPES, "an int value is expected")
+                    type_ = 'int'
             # else:
             #     raise CompileTermError("")
 
         self.write_non_terminal_end('term')
+        return type_
 
     def compile_expression_list(self):
         """Compiles a (possibly empty) comma-separated list of expressions.
 
         (expression (',' expression)*)?
+
+        :returns: the number of expressions.
         """
         current_element = 'expressionList'
         f = self._infile
@@ -474,11 +650,13 @@ class CompilationEngine:
             f.advance()
             self._safe_to_step = False
 
+        count = 0
         while f.token_type() == token_types.SYMBOL and f.symbol() != ')' or f.token_type() != token_types.SYMBOL:  # might need modification?
             try:
                 self.compile_expression()
             except CompileExpressionError:
                 break
+            count += 1
 
             try:
                 self.add_symbols([','])
@@ -487,16 +665,19 @@ class CompilationEngine:
                 break
 
         self.write_non_terminal_end(current_element)
+        return count
 
-    def add_subroutine_call(self):
+    def add_subroutine_call(self, qualifier=None):
         """Add a subroutine call.
 
+        `qualifier` is the class or variable name before the '.', if it was already added.
+
         subroutineCall: subroutineName '(' expressionList ')' | (className | varName) '.' subroutineName '(' expressionList ')'
         """
         f = self._infile
 
         try:
-            self.add_identifier('subroutine name | class name | variable name')  # requires special write
+            name = self.add_identifier('subroutine name | class name | variable name')  # requires special write
             # try:
             self.add_symbols(['(', '.'])  # requires special write
             # except CompileSymbolError:
@@ -504,43 +685,42 @@ class CompilationEngine:
             self.write_body()
             if f.token_type() == token_types.SYMBOL:
                 if f.symbol() == '(':
-                    self.compile_expression_list()
+                    arguments = self.compile_expression_list()
                     self.add_symbols([')'])
+                    if qualifier is not None and self._os_subroutines:
+                        self.check_os_call(qualifier, name, arguments)
                 elif f.symbol() == '.':
-                    self.add_subroutine_call()
+                    self.add_subroutine_call(name)
         except CompileError as ex:
-            raise CompileSubroutineCallError("Expected a complete subroutine call: " + str(ex))
+            raise CompileSubroutineCallError("Expected a complete subroutine call") from ex
 
     def add_keyword_constant(self):
         try:
-            self.add_keywords(['true', 'false', 'null', 'this'])
+            return self.add_keywords(self.KEYWORD_CONSTANTS)
         except CompileError as ex:
-            raise CompileKeywordConstantError("Expected a keyword constant: " + str(ex))
+            raise CompileKeywordConstantError("Expected a keyword constant") from ex
 
     def add_op_or_unary_op(self, unary=False):
         """Add an operator (symbol).
 
         op: '+' | '-' | '*' | '/' | '&' | '|' | '<' | '>' | '='
         """
-        f = self._infile
-
         try:
-            if unary:
-                self.add_symbols(['-', '~'])
-            else:
-                self.add_symbols((f.XML_ESCAPES[char] if char in f.XML_ESCAPES else char for char in ['+', '-', '*', '/', '&', '|', '<', '>', '=']))
+            return self.add_symbols(self.UNARY_OPS if unary else self.OPS)
         except CompileError as ex:
-            raise CompileOpError("Expected an operator: " + str(ex))
+            raise CompileOpError("Expected an operator") from ex
 
-    def add_type_var_name_var_name(self):
+    def add_type_var_name_var_name(self, symbols):
         """Add a type variable name list declaration.
 
+        Every variable name is added to `symbols` with its type.
+
         type varName (',' varName)* ;
         """
 
         f = self._infile
-        self.add_type()  # step 1 - type
-        self.add_identifier('variable name')  # step 2 - varName
+        type_ = self.add_type()  # step 1 - type
+        symbols[self.add_identifier('variable name')] = type_  # step 2 - varName
 
         # step 3/4 - (',' varName)* ';'
         # I merged these steps for convenience.
@@ -550,12 +730,14 @@ class CompilationEngine:
             if f.symbol() == ';':
                 more_vars = False
             else:
-                self.add_identifier('variable name')
+                symbols[self.add_identifier('variable name')] = type_
 
     def add_type(self, void=False):
         """Add a type declaration.
 
         type: 'int' | 'char' | 'boolean' | className
+
+        :returns: the type name.
         """
         f = self._infile
         valid_types = [token_types.INT, token_types.CHAR, token_types.BOOLEAN]
@@ -570,15 +752,20 @@ class CompilationEngine:
             terminal = f.NAMES_TABLE[f.key_word()]
             self._body += ['keyword', terminal]
             self._safe_to_step = True
+            return terminal
         elif f.token_type() == token_types.IDENTIFIER:
             self._body += ['identifier', f.identifier()]
             self._safe_to_step = True
+            return f.identifier()
         else:
-            expected = "| ".join(["'{}'".format(typ) for typ in valid_types + ['className']])
-            raise CompileTypeError("Expected {}".format(expected))
+            raise CompileTypeError("Expected {}", OneOf(valid_types + ['className']),
+                                   expected=self.RETURN_TYPE_TOKENS if void else self.TYPE_TOKENS)
 
     def add_keywords(self, keywords):
-        """Add keyword(s) definition to body element."""
+        """Add keyword(s) definition to body element.
+
+        :returns: the keyword, as in `JackTokenizer.key_word()`.
+        """
         f = self._infile
 
         if self._safe_to_step:
@@ -589,12 +776,15 @@ class CompilationEngine:
             terminal = f.NAMES_TABLE[f.key_word()]
             self._body += ['keyword', terminal]
             self._safe_to_step = True
+            return f.key_word()
         else:
-            expected = "| ".join(["'{}'".format(key) for key in keywords])
-            raise CompileKeywordError("Expected {}".format(expected))
+            raise CompileKeywordError("Expected {}", OneOf(keywords), expected=keywords)
 
     def add_symbols(self, symbols):
-        """Add symbol definition to body element."""
+        """Add symbol definition to body element.
+
+        :returns: the symbol.
+        """
         f = self._infile
 
         if self._safe_to_step:
@@ -604,12 +794,15 @@ class CompilationEngine:
         if f.token_type() == token_types.SYMBOL and any([f.symbol() == sym for sym in symbols]):
             self._body += ['symbol', f.symbol()]
             self._safe_to_step = True
+            return f.symbol()
         else:
-            expected = "| ".join(["'{}'".format(sym) for sym in symbols])
-            raise CompileSymbolError("Expected {}".format(expected))
+            raise CompileSymbolError("Expected {}", OneOf(symbols), expected=symbols)
 
     def add_identifier(self, identifier):
-        """Add identifier definition to body element."""
+        """Add identifier definition to body element.
+
+        :returns: the identifier.
+        """
         f = self._infile
 
         if self._safe_to_step:
@@ -619,39 +812,68 @@ class CompilationEngine:
         if f.token_type() == token_types.IDENTIFIER:
             self._body += ['identifier', f.identifier()]
             self._safe_to_step = True
+            return f.identifier()
+        else:
+            raise CompileError("Expected a {}", identifier, expected=('identifier',))
+
+    def check(self, check, passed, message):
+        """Record a semantic error unless `passed` or `check` is turned off."""
+        if not passed and check in self.checks:
+            self.semantic_errors.append(
+                (self._infile.line_number, "In subroutine {}: {}".format(self._subroutine_name, message)))
+
+    def check_os_call(self, qualifier, name, arguments):
+        """Check a call `qualifier.name()` with `arguments` arguments, if it calls the Jack OS."""
+        type_ = self._subroutine_symbols.get(qualifier) or self._class_symbols.get(qualifier)
+        class_name = type_ or qualifier
+        subroutines = self._os_subroutines.get(class_name)
+        if subroutines is None or class_name == self._class_name:  # not an OS class, or this class replaces it.
+            return
+        signature = subroutines.get(name)
+        call = "{}.{}".format(class_name, name)
+        self.check(OS_CALLS, signature is not None, "unknown OS subroutine: {}".format(call))
+        if signature is None:
+            return
+        kind, parameters = signature
+        if type_ is None:
+            self.check(OS_CALLS, kind != 'method',
+                       "wrong kind of OS call: {} is a method, call it on an object".format(call))
         else:
-            raise CompileError("Expected a {}".format(identifier))
+            self.check(OS_CALLS, kind == 'method',
+                       "wrong kind of OS call: {} is a {}, call it on the class".format(call, kind))
+        self.check(OS_CALLS, arguments == parameters,
+                   "wrong number of arguments: {} takes {}, got {}".format(call, parameters, arguments))
 
     def write_body(self):
         for inner_element, terminal in self._body:  # write all body
-            self._outfile.write(' ' * self._indent)
             self.write_terminal(inner_element, terminal)
 
-    def write_terminal(self, element, terminal, indent=False):
-        """Write a terminating xml element."""
-        if indent:
-            self._outfile.write(' ' * self._indent)
-        print('<{element}> {terminal} </{element}>'.format(element=element, terminal=terminal), file=self._outfile)
+    @staticmethod
+    def _write_nothing():
+        """`write_body()` when checking syntax only."""
+
+    def write_terminal(self, element, terminal):
+        """Write a terminating element."""
+        self._emitter.write_terminal(element, terminal)
 
     def write_non_terminal_start(self, element):
-        """Write the start of a non-terminating xml element.
+        """Write the start of a non-terminating element.
 
         uses self._body generator.
         """
-        self._outfile.write(' ' * self._indent)
-        print("<{}>".format(element), file=self._outfile)
-
-        self._indent += 2  # on every body section increase indent.
+        if self._governor is not None:
+            self._governor.enter()
+        self._emitter.write_non_terminal_start(element)
         self.write_body()
 
     def write_non_terminal_end(self, element):
-        """Write the end of a non-terminating xml element."""
+        """Write the end of a non-terminating element."""
 
         # write any trailing body elements.
         self.write_body()
-        self._indent -= 2  # after every body section decrease indent.
-        self._outfile.write(' ' * self._indent)
-        print("</{}>".format(element), file=self._outfile)
+        self._emitter.write_non_terminal_end(element)
+        if self._governor is not None:
+            self._governor.exit()
 
     def write_non_terminal(self, element):
         """Write a non-terminating xml element.
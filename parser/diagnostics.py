@@ -0,0 +1,147 @@
+"""Structured diagnostics, for tools and dashboards rather than people.
+
+A `Diagnostic` is made from the `CompileError` that stopped a compile, or
+from a semantic error, where it is reported. Nothing is formatted until its
+`message` or `expected` is read, and `to_dict()` and `write_json_lines()`
+export it as json:
+
+    {"file": "Main.jack", "code": "E102", "line": 41, "token": "}",
+     "span": [512, 513], "rule_path": ["subroutineDec", "subroutineBody",
+     "letStatement"], "expected": [";"], "message": "Expected a complete ..."}
+
+`line` is the token number the engines print as the line of an error, and
+`span` the (start, end) source offsets of the offending token, only known
+when the tokenizer records offsets.
+"""
+import functools
+import json
+
+from parser.utils.exceptions import CompileError
+
+# semantic check message, up to any ': ' and details: code, see `CompilationEngine.check()`.
+SEMANTIC_CODES = {
+    "A constructor must return 'this'": 'S301',
+    "a boolean value is expected": 'S302',
+    "an int value is expected": 'S303',
+    "unknown OS subroutine": 'S304',
+    "wrong kind of OS call": 'S305',
+    "wrong number of arguments": 'S306',
+}
+SEMANTIC_CODE = 'S300'  # a semantic error of an unknown check.
+
+
+@functools.lru_cache(maxsize=None)
+def first_set(rule):
+    """The FIRST set of a rule of `jack.grammar`, as sorted token names.
+
+    Computed once per rule from the grammar's precomputed FIRST sets, which
+    are only loaded when a diagnostic asks for one.
+    """
+
+    from parser.ll1_engine import jack_grammar, TOKEN_KINDS, EMPTY
+
+    names = {kind: name for name, kind in TOKEN_KINDS.items()}
+    return tuple(sorted(names.get(key, key) for key in jack_grammar().first.get(rule, ()) if key != EMPTY))
+
+
+class Diagnostic:
+    """One error of a compile.
+
+    `code` is the `CompileError.code` of the innermost error (the reason,
+    eg: 'E102' a symbol was expected) and `rule_path` the grammar rules that
+    failed because of it, outermost first.
+    """
+
+    __slots__ = ('code', 'line', 'token', 'span', 'rule_path', '_error', '_message', '_expected')
+
+    def __init__(self, code, line, message=None, token=None, span=None, rule_path=(), expected=None, error=None):
+        self.code = code
+        self.line = line
+        self.token = token
+        self.span = span
+        self.rule_path = rule_path
+        self._error = error
+        self._message = message
+        self._expected = expected
+
+    @classmethod
+    def from_error(cls, error, tokenizer=None):
+        """A diagnostic of the error that stopped a compile, at the current token of `tokenizer`."""
+        chain = []
+        cause = error
+        while isinstance(cause, CompileError):
+            chain.append(cause)
+            cause = cause.__cause__
+        innermost = chain[-1]
+
+        line = token = span = None
+        if tokenizer is not None:
+            line = tokenizer.line_number
+            token = getattr(tokenizer, 'token', None)
+            offsets = getattr(tokenizer, 'offsets', None)
+            index = line - 2  # line_number counts from 1 and is bumped before the token is read.
+            if offsets and 0 <= index < len(offsets):
+                span = tuple(offsets[index])
+        rule_path = tuple(link.rule for link in chain if link.rule)
+        return cls(innermost.code, line, token=token, span=span, rule_path=rule_path, error=error)
+
+    @classmethod
+    def from_semantic_error(cls, line, message):
+        """A diagnostic of a (line number, message) of `CompilationEngine.semantic_errors`."""
+        check_message = (message.partition(': ')[2] or message).partition(': ')[0]
+        return cls(SEMANTIC_CODES.get(check_message, SEMANTIC_CODE), line, message)
+
+    @property
+    def message(self):
+        if self._message is None:
+            self._message = str(self._error)
+        return self._message
+
+    @property
+    def expected(self):
+        """The tokens that would have been accepted, as a tuple, empty if unknown."""
+        if self._expected is None:
+            expected = ()
+            innermost = self._error
+            while isinstance(innermost, CompileError) and isinstance(innermost.__cause__, CompileError):
+                innermost = innermost.__cause__
+            if innermost is not None:
+                if innermost.expected is not None:
+                    expected = tuple(innermost.expected)
+                elif innermost.first is not None:
+                    expected = first_set(innermost.first)
+            self._expected = expected
+        return self._expected
+
+    def to_dict(self):
+        return {
+            'code': self.code,
+            'line': self.line,
+            'token': self.token,
+            'span': list(self.span) if self.span is not None else None,
+            'rule_path': list(self.rule_path),
+            'expected': list(self.expected),
+            'message': self.message,
+        }
+
+    def __iter__(self):
+        # unpacks as the (line number, message) pairs the engines report.
+        return iter((self.line, self.message))
+
+    def __str__(self):
+        return self.message
+
+    def __repr__(self):
+        return "<Diagnostic {} line={} {!r}>".format(self.code, self.line, self.message)
+
+
+def write_json_lines(diagnostics, outfile, file=None):
+    """Write diagnostics to a text stream, one json object per line.
+
+    `file` is added to every object as the name of the source they are about.
+    """
+    for diagnostic in diagnostics:
+        record = diagnostic.to_dict()
+        if file is not None:
+            record = dict(file=file, **record)
+        outfile.write(json.dumps(record) + '\n')
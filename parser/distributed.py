@@ -0,0 +1,265 @@
+import collections
+import json
+import threading
+from multiprocessing.connection import Listener, Client
+
+BATCH_SIZE = 8  # files handed to a worker at a time.
+MAX_ATTEMPTS = 3  # a file is given up on after this many workers died compiling it.
+MONITOR_INTERVAL = 0.2
+
+
+def parse_address(text):
+    """'host:port' is a TCP address, anything else is the path of a Unix socket."""
+    host, sep, port = text.rpartition(':')
+    if sep and port.isdigit():
+        return host or 'localhost', int(port)
+    return text
+
+
+def crash_message(error):
+    """The diagnostic message of a compile that raised `error`, something other than a `CompileError`."""
+    return "Compile failed: {}: {}".format(type(error).__name__, error)
+
+
+def send_message(conn, message, frames=()):
+    """Send a json message followed by raw byte frames."""
+    conn.send_bytes(json.dumps(message).encode())
+    for frame in frames:
+        conn.send_bytes(frame)
+
+
+def receive_message(conn):
+    return json.loads(conn.recv_bytes().decode())
+
+
+class Coordinator:
+    """Hands out the files of a build to workers connecting over a socket.
+
+    Workers pull batches of `batch_size` files and report every file as
+    soon as it is compiled. When there is nothing left to hand out, an idle
+    worker steals the back half of the files another worker has not started
+    yet, and the victim is told to drop them with its next acknowledgement.
+    The files of a worker whose connection breaks are put back in the queue,
+    up to `max_attempts` times each, then they fail.
+
+    Messages are json (never pickle), sources and outputs follow them as
+    raw byte frames, and connections are authenticated with `authkey`.
+    """
+
+    def __init__(self, sources, address, authkey, on_result, batch_size=BATCH_SIZE, max_attempts=MAX_ATTEMPTS):
+        """`sources` is a list of (name, source text).
+
+        `on_result(name, outputs, diagnostics)` is called once for every file,
+        from the thread of the worker that compiled it. `outputs` is
+        {file extension: str or bytes} and `diagnostics` a list of
+        (line number or None, message).
+        """
+        self.sources = sources
+        self.on_result = on_result
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+
+        self._queue = collections.deque(range(len(sources)))
+        self._assigned = {}  # worker id: file ids in the order it compiles them, the first is in progress.
+        self._revoked = {}  # worker id: stolen file ids it must drop.
+        self._attempts = collections.Counter()
+        self._remaining = len(sources)
+        self._condition = threading.Condition()
+        self._result_lock = threading.Lock()
+        self._closed = False
+        self._threads = []
+
+    def run(self, monitor=None):
+        """Serve workers until every file is compiled or given up on.
+
+        `monitor()` is called about every `MONITOR_INTERVAL` seconds
+        meanwhile, eg: to replace local workers that died. It returns
+        whether any of its workers is left, if none is and no other worker
+        is connected, the files not compiled yet fail at once rather than
+        waiting for workers forever.
+
+        :returns: False if files failed for lack of workers.
+        """
+        accept_thread = threading.Thread(target=self._accept, daemon=True)
+        accept_thread.start()
+        workers_left = True
+        with self._condition:
+            while workers_left and not self._condition.wait_for(lambda: not self._remaining, MONITOR_INTERVAL):
+                if monitor is not None:
+                    self._condition.release()
+                    try:
+                        workers_left = monitor()
+                    finally:
+                        self._condition.acquire()
+                    workers_left = workers_left or bool(self._assigned)
+        if not workers_left:
+            self._fail_remaining("No workers left to compile it")
+        self._closed = True
+        self.listener.close()
+        for thread in self._threads:
+            thread.join(timeout=1)  # let idle workers hear they are done.
+        return workers_left
+
+    def _accept(self):
+        worker_id = 0
+        while True:
+            try:
+                conn = self.listener.accept()
+            except Exception:
+                if self._closed:
+                    return
+                continue  # failed authentication or a broken handshake, keep serving the others.
+            worker_id += 1
+            thread = threading.Thread(target=self._serve, args=(worker_id, conn), daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _serve(self, worker_id, conn):
+        with self._condition:
+            self._assigned[worker_id] = []
+            self._revoked[worker_id] = set()
+        try:
+            with conn:
+                while True:
+                    message = receive_message(conn)
+                    if message['op'] == 'ready':
+                        batch = self._take_batch(worker_id)
+                        if not batch:
+                            send_message(conn, {'op': 'done'})
+                            return
+                        send_message(conn, {'op': 'batch', 'files': batch},
+                                     (self.sources[file_id][1].encode() for file_id in batch))
+                    elif message['op'] == 'result':
+                        outputs = {}
+                        for extension, binary in message['outputs']:
+                            frame = conn.recv_bytes()
+                            outputs[extension] = frame if binary else frame.decode()
+                        diagnostics = [tuple(diagnostic) for diagnostic in message['diagnostics']]
+                        revoked = self._finish(worker_id, message['file'], outputs, diagnostics)
+                        send_message(conn, {'op': 'ack', 'revoked': revoked})
+        except (EOFError, OSError):
+            self._lost(worker_id)
+
+    def _take_batch(self, worker_id):
+        """Wait for files to hand to this worker, stealing them if the queue is empty.
+
+        :returns: a list of file ids, empty once every file is done.
+        """
+        with self._condition:
+            while self._remaining:
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                if not batch:
+                    batch = self._steal()
+                if batch:
+                    self._assigned[worker_id].extend(batch)
+                    return batch
+                self._condition.wait()
+            return []
+
+    def _steal(self):
+        """Take the back half of the unstarted files of the busiest worker."""
+        victim = max(self._assigned, key=lambda worker_id: len(self._assigned[worker_id]), default=None)
+        if victim is None:
+            return []
+        assigned = self._assigned[victim]
+        unstarted = len(assigned) - 1
+        if unstarted < 1:
+            return []
+        stolen = assigned[len(assigned) - (unstarted + 1) // 2:]
+        del assigned[len(assigned) - len(stolen):]
+        self._revoked[victim].update(stolen)
+        return stolen
+
+    def _finish(self, worker_id, file_id, outputs, diagnostics):
+        with self._condition:
+            assigned = self._assigned[worker_id]
+            if file_id not in assigned:
+                return []  # another worker owns it now.
+            assigned.remove(file_id)
+            revoked = sorted(self._revoked[worker_id])
+            self._revoked[worker_id].clear()
+
+        try:
+            with self._result_lock:
+                self.on_result(self.sources[file_id][0], outputs, diagnostics)
+        finally:
+            with self._condition:
+                self._remaining -= 1
+                self._condition.notify_all()
+        return revoked
+
+    def _lost(self, worker_id):
+        """Put the files of a dead worker back in the queue.
+
+        Only the file it was compiling counts as an attempt, the rest were never started.
+        """
+        failed = []
+        with self._condition:
+            assigned = self._assigned.pop(worker_id)
+            if assigned:
+                self._attempts[assigned[0]] += 1
+                if self._attempts[assigned[0]] >= self.max_attempts:
+                    failed.append(assigned.pop(0))
+            self._queue.extendleft(reversed(assigned))
+            self._revoked.pop(worker_id)
+            self._condition.notify_all()
+
+        self._fail(failed, "Gave up after {} worker(s) died compiling it".format(self.max_attempts))
+
+    def _fail_remaining(self, message):
+        """Fail every file not compiled yet, a result for one of them coming in later is dropped."""
+        with self._condition:
+            failed = list(self._queue)
+            self._queue.clear()
+            for assigned in self._assigned.values():
+                failed.extend(assigned)
+                assigned.clear()
+        self._fail(failed, message)
+
+    def _fail(self, file_ids, message):
+        for file_id in file_ids:
+            with self._result_lock:
+                self.on_result(self.sources[file_id][0], {}, [(None, message)])
+            with self._condition:
+                self._remaining -= 1
+                self._condition.notify_all()
+
+
+def run_worker(address, authkey, compile_source):
+    """Compile the files a `Coordinator` hands out until it has none left.
+
+    `compile_source(source)` returns the ({file extension: str or bytes},
+    diagnostics) of a file, see `Coordinator`. A file it raises on, eg: a
+    `RecursionError`, is reported with no outputs and the worker goes on.
+    """
+
+    with Client(address, authkey=authkey) as conn:
+        pending = collections.deque()
+        while True:
+            if not pending:
+                send_message(conn, {'op': 'ready'})
+                try:
+                    message = receive_message(conn)
+                except (EOFError, OSError):
+                    return  # the coordinator finished before telling us.
+                if message['op'] == 'done':
+                    return
+                pending.extend((file_id, conn.recv_bytes().decode()) for file_id in message['files'])
+
+            file_id, source = pending.popleft()
+            try:
+                outputs, diagnostics = compile_source(source)
+            except Exception as ex:
+                outputs, diagnostics = {}, [(None, crash_message(ex))]
+            send_message(conn, {
+                'op': 'result',
+                'file': file_id,
+                'diagnostics': diagnostics,
+                'outputs': [(extension, isinstance(output, bytes)) for extension, output in outputs.items()],
+            }, (output if isinstance(output, bytes) else output.encode() for output in outputs.values()))
+
+            revoked = set(receive_message(conn)['revoked'])
+            if revoked:
+                pending = collections.deque(item for item in pending if item[0] not in revoked)
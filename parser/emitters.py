@@ -0,0 +1,307 @@
+import abc
+import json
+
+from parser.jack_tokenizer import JackTokenizer
+
+
+# element names that appear in the parse tree, in binary format code order.
+ELEMENTS = [
+    'class', 'classVarDec', 'subroutineDec', 'parameterList', 'subroutineBody',
+    'varDec', 'statements', 'letStatement', 'ifStatement', 'whileStatement',
+    'doStatement', 'returnStatement', 'expression', 'term', 'expressionList',
+    'keyword', 'symbol', 'identifier', 'integerConstant', 'stringConstant',
+]
+ELEMENT_CODES = {element: code for code, element in enumerate(ELEMENTS)}
+TERMINALS = {'keyword', 'symbol', 'identifier', 'integerConstant', 'stringConstant'}
+
+# Undo the xml escaping the tokenizer does on symbols, and only on them.
+XML_UNESCAPES = {escaped: char for char, escaped in JackTokenizer.XML_ESCAPES.items()}
+
+BINARY_MAGIC = b'JKB\x01'
+SOURCE_MAP_MAGIC = b'JKM\x01'
+
+
+class Emitter(abc.ABC):
+    """Receives the parse tree from a `CompilationEngine` as a stream of events.
+
+    The engine calls `write_non_terminal_start()` and `write_non_terminal_end()`
+    around every non-terminal and `write_terminal()` for every terminal, in source order.
+    """
+
+    @abc.abstractmethod
+    def write_non_terminal_start(self, element):
+        pass
+
+    @abc.abstractmethod
+    def write_non_terminal_end(self, element):
+        pass
+
+    @abc.abstractmethod
+    def write_terminal(self, element, terminal):
+        """`terminal` is as written in the xml: symbols are xml escaped, see `JackTokenizer.XML_ESCAPES`."""
+
+
+class XmlEmitter(Emitter):
+    """Writes the indented xml of the specs of project 10."""
+
+    def __init__(self, outfile):
+        self._outfile = outfile
+        self._indent = 0
+
+    def write_non_terminal_start(self, element):
+        self._outfile.write(' ' * self._indent)
+        print("<{}>".format(element), file=self._outfile)
+        self._indent += 2  # on every body section increase indent.
+
+    def write_non_terminal_end(self, element):
+        self._indent -= 2  # after every body section decrease indent.
+        self._outfile.write(' ' * self._indent)
+        print("</{}>".format(element), file=self._outfile)
+
+    def write_terminal(self, element, terminal):
+        self._outfile.write(' ' * self._indent)
+        print('<{element}> {terminal} </{element}>'.format(element=element, terminal=terminal), file=self._outfile)
+
+
+class JsonLinesEmitter(Emitter):
+    """Writes one compact json array per line.
+
+    ["class"] opens a non-terminal, [] closes the innermost open one and
+    ["keyword", "class"] is a terminal. Terminal values are not xml escaped.
+    """
+
+    def __init__(self, outfile):
+        self._outfile = outfile
+
+    def write_non_terminal_start(self, element):
+        self._outfile.write('["{}"]\n'.format(element))
+
+    def write_non_terminal_end(self, element):
+        self._outfile.write('[]\n')
+
+    def write_terminal(self, element, terminal):
+        terminal = str(terminal)
+        if element == 'symbol':
+            terminal = XML_UNESCAPES.get(terminal, terminal)
+        self._outfile.write('["{}",{}]\n'.format(element, json.dumps(terminal)))
+
+
+class BinaryEmitter(Emitter):
+    """Writes a length-prefixed binary tree to a binary stream.
+
+    The stream starts with `BINARY_MAGIC`, followed by the root node.
+    Every node is its one byte element code (an index into `ELEMENTS`) and a
+    varint byte length, followed by the utf-8 value of a terminal or
+    the concatenated child nodes of a non-terminal.
+    """
+
+    def __init__(self, outfile):
+        self._outfile = outfile
+        self._stack = []  # bytearray of the children of each open non-terminal.
+
+    def write_non_terminal_start(self, element):
+        if not self._stack:
+            self._outfile.write(BINARY_MAGIC)
+        self._stack.append(bytearray())
+
+    def write_non_terminal_end(self, element):
+        node = bytearray([ELEMENT_CODES[element]])
+        body = self._stack.pop()
+        write_varint(node, len(body))
+        node += body
+        if self._stack:
+            self._stack[-1] += node
+        else:
+            self._outfile.write(node)
+
+    def write_terminal(self, element, terminal):
+        terminal = str(terminal)
+        if element == 'symbol':
+            terminal = XML_UNESCAPES.get(terminal, terminal)
+        value = terminal.encode()
+        node = self._stack[-1]
+        node.append(ELEMENT_CODES[element])
+        write_varint(node, len(value))
+        node += value
+
+
+class SourceMapEmitter(Emitter):
+    """Writes the source offsets of every element of the parse tree to a binary stream.
+
+    Elements are numbered in output order, as their start tag (or terminal
+    line) appears in the xml. The stream is `SOURCE_MAP_MAGIC`, a varint
+    element count, the start offset of each element as a zigzag varint
+    delta from the previous one, then the varint length of each element.
+    Offsets are character offsets into the source, as recorded by a
+    `JackTokenizer` made with `record_offsets=True`. A non-terminal spans
+    its terminals, an empty one is an empty span after the last token before it.
+
+    Every token of the source is output as one terminal, in source order,
+    so the nth terminal is the nth token of `tokenizer.offsets`.
+    """
+
+    def __init__(self, outfile, tokenizer):
+        self._outfile = outfile
+        self._tokenizer = tokenizer
+        self._first = []  # index of the first token of each element.
+        self._last = []  # index after the last token of each element.
+        self._stack = []  # element index of each open non-terminal.
+        self._tokens = 0  # terminals written so far.
+
+    def write_non_terminal_start(self, element):
+        self._stack.append(len(self._first))
+        self._first.append(self._tokens)
+        self._last.append(None)
+
+    def write_non_terminal_end(self, element):
+        self._last[self._stack.pop()] = self._tokens
+        if not self._stack:
+            self._outfile.write(dump_source_map(self._first, self._last, self._tokenizer.offsets))
+
+    def write_terminal(self, element, terminal):
+        self._first.append(self._tokens)
+        self._tokens += 1
+        self._last.append(self._tokens)
+
+
+class NullEmitter(Emitter):
+    """Discards the parse tree, for checking syntax only.
+
+    Engines given one don't buffer terminals at all, see `CompilationEngine`.
+    """
+
+    def write_non_terminal_start(self, element):
+        pass
+
+    def write_non_terminal_end(self, element):
+        pass
+
+    def write_terminal(self, element, terminal):
+        pass
+
+
+class RecordingEmitter(Emitter):
+    """Records events so they can be replayed into another emitter later."""
+
+    def __init__(self):
+        self.events = []
+
+    def write_non_terminal_start(self, element):
+        self.events.append(('write_non_terminal_start', element))
+
+    def write_non_terminal_end(self, element):
+        self.events.append(('write_non_terminal_end', element))
+
+    def write_terminal(self, element, terminal):
+        self.events.append(('write_terminal', element, terminal))
+
+
+class FanOutEmitter(Emitter):
+    """Feeds one parse into several emitters at once."""
+
+    def __init__(self, emitters):
+        self._emitters = list(emitters)
+
+    def write_non_terminal_start(self, element):
+        for emitter in self._emitters:
+            emitter.write_non_terminal_start(element)
+
+    def write_non_terminal_end(self, element):
+        for emitter in self._emitters:
+            emitter.write_non_terminal_end(element)
+
+    def write_terminal(self, element, terminal):
+        for emitter in self._emitters:
+            emitter.write_terminal(element, terminal)
+
+
+def replay(events, emitter):
+    """Replay events recorded by a `RecordingEmitter` into `emitter`."""
+    for method, *args in events:
+        getattr(emitter, method)(*args)
+
+
+def write_varint(buffer, value):
+    """Append `value` to `buffer` as an unsigned LEB128 varint."""
+    while value > 0x7f:
+        buffer.append(value & 0x7f | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(data, pos):
+    """Read an unsigned LEB128 varint from `data` at `pos`.
+
+    :returns: (value, position after the varint)
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def dump_source_map(first, last, offsets):
+    """Encode element token ranges as a source map, see `SourceMapEmitter`."""
+    starts = bytearray()
+    lengths = bytearray()
+    previous = 0
+    for first_token, last_token in zip(first, last):
+        if first_token < last_token:
+            start, end = offsets[first_token][0], offsets[last_token - 1][1]
+        else:
+            start = end = offsets[first_token - 1][1] if first_token else 0
+        delta = start - previous
+        write_varint(starts, delta << 1 if delta >= 0 else (-delta << 1) - 1)  # zigzag, deltas are rarely negative.
+        write_varint(lengths, end - start)
+        previous = start
+
+    data = bytearray(SOURCE_MAP_MAGIC)
+    write_varint(data, len(first))
+    return bytes(data + starts + lengths)
+
+
+def load_source_map(data):
+    """Load the output of `SourceMapEmitter` back into a list of (start, end) offsets."""
+    if data[:len(SOURCE_MAP_MAGIC)] != SOURCE_MAP_MAGIC:
+        raise ValueError("Not a source map.")
+
+    count, pos = read_varint(data, len(SOURCE_MAP_MAGIC))
+    starts = []
+    start = 0
+    for _ in range(count):
+        delta, pos = read_varint(data, pos)
+        start += -(delta + 1 >> 1) if delta & 1 else delta >> 1
+        starts.append(start)
+    spans = []
+    for start in starts:
+        length, pos = read_varint(data, pos)
+        spans.append((start, start + length))
+    return spans
+
+
+def load_binary_tree(data):
+    """Load the output of `BinaryEmitter` back into nested tuples.
+
+    A terminal becomes (element, value) and a non-terminal becomes (element, [children]).
+    """
+    if data[:len(BINARY_MAGIC)] != BINARY_MAGIC:
+        raise ValueError("Not a binary parse tree.")
+
+    def load_node(pos):
+        element = ELEMENTS[data[pos]]
+        length, pos = read_varint(data, pos + 1)
+        end = pos + length
+        if element in TERMINALS:
+            return (element, bytes(data[pos:end]).decode()), end
+        children = []
+        while pos < end:
+            child, pos = load_node(pos)
+            children.append(child)
+        return (element, children), end
+
+    return load_node(len(BINARY_MAGIC))[0]
@@ -0,0 +1,465 @@
+from parser.compilation_engine import (
+    CompilationEngine,
+    CONSTRUCTOR_RETURN,
+    BOOLEAN_CONDITION,
+    INT_OPERAND,
+    INT_TYPES,
+    BOOLEAN_TYPES,
+)
+from parser.utils import token_types
+from parser.utils.exceptions import (
+    CompileError,
+    CompileKeywordError,
+    CompileSymbolError,
+    CompileLetError,
+    CompileExpressionError,
+    CompileOpError,
+    CompileDoError,
+    CompileSubroutineCallError,
+    CompileReturnError,
+    CompileIfError,
+    CompileWhileError,
+)
+
+
+class IterativeCompilationEngine(CompilationEngine):
+    """A `CompilationEngine` that keeps nested statements and expressions off the Python stack.
+
+    `compile_expression` -> `compile_term` -> `compile_expression` and
+    `compile_statements` -> `compile_if` -> `compile_statements` recurse once
+    per nesting level, so deeply nested code raises `RecursionError`.
+
+    Here each of those rules is a generator that yields the generator of a
+    nested rule instead of calling it. `run()` keeps the open rules on an
+    explicit stack, sends each result back to its caller and throws
+    each error into it, so the output and error messages are exactly those
+    of `CompilationEngine`, at any nesting depth.
+
+    Jack has no operator precedence, an expression is a flat list of terms,
+    so the nesting only comes from '(' expression ')', unary ops, array
+    indexes and subroutine call arguments.
+    """
+
+    @staticmethod
+    def run(rule):
+        """Run a rule generator and all the rules it yields to completion.
+
+        :returns: what the rule returns.
+        """
+
+        stack = [rule]
+        value = None
+        error = None
+        while stack:
+            try:
+                if error is None:
+                    nested_rule = stack[-1].send(value)
+                else:
+                    # handled once thrown, even if the rule catches it and returns.
+                    thrown, error = error, None
+                    nested_rule = stack[-1].throw(thrown)
+            except StopIteration as stop:
+                stack.pop()
+                value = stop.value
+                continue
+            except Exception as ex:
+                stack.pop()
+                if not stack:
+                    raise
+                error = ex
+                continue
+
+            stack.append(nested_rule)
+            value = None
+        return value
+
+    def compile_statements(self):
+        return self.run(self.statements())
+
+    def compile_do(self):
+        return self.run(self.do())
+
+    def compile_let(self):
+        return self.run(self.let())
+
+    def compile_while(self):
+        return self.run(self.while_())
+
+    def compile_return(self):
+        return self.run(self.return_())
+
+    def compile_if(self):
+        return self.run(self.if_())
+
+    def compile_expression(self):
+        return self.run(self.expression())
+
+    def compile_term(self):
+        return self.run(self.term())
+
+    def compile_expression_list(self):
+        return self.run(self.expression_list())
+
+    def add_subroutine_call(self, qualifier=None):
+        return self.run(self.subroutine_call(qualifier))
+
+    def statements(self):
+        """statements: statement*"""
+
+        f = self._infile
+        current_element = "statements"
+
+        self.write_non_terminal_start(current_element)
+
+        if f.token_type() == token_types.SYMBOL and f.symbol() == '{':
+            f.advance()
+            self._safe_to_step = False
+
+        while f.token_type() == token_types.KEYWORD:
+            if f.key_word() == token_types.LET:
+                yield self.let()
+            elif f.key_word() == token_types.IF:
+                yield self.if_()
+            elif f.key_word() == token_types.WHILE:
+                yield self.while_()
+            elif f.key_word() == token_types.DO:
+                yield self.do()
+            elif f.key_word() == token_types.RETURN:
+                yield self.return_()
+            else:
+                raise CompileKeywordError("Expected let | if | while | do | return", first='_statement')
+            if self._safe_to_step:
+                f.advance()
+                self._safe_to_step = False
+
+        self.write_non_terminal_end(current_element)
+
+    def do(self):
+        """doStatement: 'do' subroutineCall ';'"""
+
+        current_element = 'doStatement'
+
+        try:
+            self.add_keywords(['do'])
+            self.write_non_terminal_start(current_element)
+
+            yield self.subroutine_call()
+            self.add_symbols([';'])
+        except CompileError as ex:
+            raise CompileDoError("Expected a complete do statement") from ex
+        self.write_non_terminal_end(current_element)
+
+    def let(self):
+        """letStatement: 'let' varName ('[' expression ']')? = expression ';'"""
+
+        current_element = 'letStatement'
+
+        try:
+            self.add_keywords(['let'])
+            self.add_identifier('variable name')
+            self.write_non_terminal_start(current_element)
+
+            # optional expression
+            expression = True
+            try:
+                self.add_symbols(['['])
+                self.write_body()
+            except CompileSymbolError:
+                expression = False
+
+            if expression:
+                self.check(INT_OPERAND, (yield self.expression()) in INT_TYPES, "an int value is expected")
+                self.add_symbols([']'])
+
+            self.add_symbols(['='])
+            self.write_body()
+
+            yield self.expression()
+            self.add_symbols([';'])
+        except CompileError as ex:
+            raise CompileLetError("Expected a complete let statement") from ex
+
+        self.write_non_terminal_end(current_element)
+
+    def while_(self):
+        """whileStatement: 'while' '(' expression ')' '{' statements '}"""
+
+        current_element = 'whileStatement'
+
+        try:
+            self.add_keywords(['while'])
+            self.add_symbols(['('])
+            self.write_non_terminal_start(current_element)
+            self.check(BOOLEAN_CONDITION, (yield self.expression()) in BOOLEAN_TYPES, "a boolean value is expected")
+            self.add_symbols([')'])
+            self.add_symbols(['{'])
+            self.write_body()
+            yield self.statements()
+            self.add_symbols(['}'])
+        except CompileError as ex:
+            raise CompileWhileError("Exprected a complete while statement") from ex
+
+        self.write_non_terminal_end(current_element)
+
+    def return_(self):
+        """returnStatement: 'return' expression? ';'"""
+
+        current_element = 'returnStatement'
+
+        try:
+            self.add_keywords(['return'])
+            self.write_non_terminal_start(current_element)
+
+            type_ = None
+            try:
+                self.add_symbols([';'])  # if next element is ';', just move on.
+            except CompileSymbolError:  # if it wasn't it should be an expression
+                try:
+                    type_ = yield self.expression()  # optional expression
+                except CompileExpressionError:
+                    pass
+                self.add_symbols([';'])  # followed by a ';'
+
+            if self._subroutine_kind == token_types.CONSTRUCTOR:
+                self.check(CONSTRUCTOR_RETURN, type_ == 'this', "A constructor must return 'this'")
+        except CompileError as ex:
+            raise CompileReturnError("Expected a complete return statement") from ex
+        self.write_non_terminal_end(current_element)
+
+    def if_(self):
+        """ifStatement: 'if' '(' expression ')' '{' statements '}' ('else' '{' statements '}')?"""
+
+        current_element = 'ifStatement'
+        f = self._infile
+
+        try:
+            self.add_keywords(['if'])
+            self.add_symbols(['('])
+            self.write_non_terminal_start(current_element)
+
+            self.check(BOOLEAN_CONDITION, (yield self.expression()) in BOOLEAN_TYPES, "a boolean value is expected")
+            self.add_symbols([')'])
+            self.add_symbols(['{'])
+            self.write_body()
+
+            yield self.statements()
+            self.add_symbols(['}'])
+
+            f.advance()
+            self._safe_to_step = False
+            if f.token_type() == token_types.KEYWORD and f.key_word() == token_types.ELSE:
+                self.add_keywords(['else'])
+                self.add_symbols(['{'])
+                self.write_body()
+                yield self.statements()
+                self.add_symbols(['}'])
+        except CompileError as ex:
+            raise CompileIfError("Expected a complete if statement") from ex
+
+        self.write_non_terminal_end(current_element)
+
+    def expression(self):
+        """expression: term (op term)*"""
+
+        current_element = "expression"
+        self.write_non_terminal_start(current_element)
+
+        try:
+            type_ = yield self.term()
+
+            while True:
+                try:
+                    op = self.add_op_or_unary_op()
+                    self.write_body()
+                    right_type = yield self.term()
+                except CompileOpError:
+                    break  # no (op term)* exists!
+
+                if op in self.ARITHMETIC_OPS or op in self.COMPARISON_OPS:
+                    self.check(INT_OPERAND, type_ in INT_TYPES and right_type in INT_TYPES, "an int value is expected")
+                    type_ = 'int' if op in self.ARITHMETIC_OPS else 'boolean'
+                elif op == '=':
+                    type_ = 'boolean'
+                elif type_ != right_type:  # '&' | '|' are bitwise for ints and logical for booleans.
+                    type_ = None
+        except CompileError as ex:
+            raise CompileExpressionError("Expected a complete expression") from ex
+        self.write_non_terminal_end(current_element)
+        return type_
+
+    def term(self):
+        """term: integerConstant | stringConstant | keywordConstant | varName | varName '[' expression ']' | subroutineCall | '(' expression ')' | unaryOp term"""
+
+        f = self._infile
+        current_element = "term"
+        self.write_non_terminal_start(current_element)
+
+        if self._safe_to_step:
+            f.advance()
+            self._safe_to_step = False
+
+        type_ = None
+        if f.token_type() == token_types.INT_CONST:
+            self._body += ['integerConstant', f.int_val()]
+            self._safe_to_step = True
+            type_ = 'int'
+        elif f.token_type() == token_types.STRING_CONST:
+            self._body += ['stringConstant', f.string_val()]
+            self._safe_to_step = True
+            type_ = 'String'
+        elif f.token_type() == token_types.KEYWORD:
+            type_ = self.KEYWORD_CONSTANT_TYPES.get(self.add_keyword_constant())
+        elif f.token_type() == token_types.IDENTIFIER:
+            name = self.add_identifier('variable name | subroutine name | class name')
+            f.advance()
+            self._safe_to_step = False
+            type_ = self._subroutine_symbols.get(name) or self._class_symbols.get(name)
+            if f.token_type() == token_types.SYMBOL:
+                if f.symbol() == '[':
+                    type_ = None  # array elements are untyped.
+                    self.add_symbols(['['])
+                    self.write_body()
+                    self.check(INT_OPERAND, (yield self.expression()) in INT_TYPES, "an int value is expected")
+                    self.add_symbols([']'])
+                elif f.symbol() == '(':
+                    type_ = None
+                    self.add_symbols(['('])
+                    self.write_body()
+                    yield self.expression_list()
+                    self.add_symbols([')'])
+                elif f.symbol() == '.':
+                    type_ = None
+                    self.add_symbols(['.'])
+                    self.write_body()
+                    yield self.subroutine_call(name)
+        elif f.token_type() == token_types.SYMBOL:
+            if f.symbol() == '(':
+                self.add_symbols(['('])
+                self.write_body()
+                type_ = yield self.expression()
+                self.add_symbols([')'])
+            elif f.symbol() in ['-', '~']:
+                op = self.add_op_or_unary_op(unary=True)
+                self.write_body()
+                type_ = yield self.term()
+                if op == '-':
+                    self.check(INT_OPERAND, type_ in INT_TYPES, "an int value is expected")
+                    type_ = 'int'
+
+        self.write_non_terminal_end('term')
+        return type_
+
+    def expression_list(self):
+        """expressionList: (expression (',' expression)*)?"""
+
+        current_element = 'expressionList'
+        f = self._infile
+
+        self.write_non_terminal_start(current_element)
+        if self._safe_to_step:
+            f.advance()
+            self._safe_to_step = False
+
+        count = 0
+        while f.token_type() == token_types.SYMBOL and f.symbol() != ')' or f.token_type() != token_types.SYMBOL:
+            try:
+                yield self.expression()
+            except CompileExpressionError:
+                break
+            count += 1
+
+            try:
+                self.add_symbols([','])
+                self.write_body()
+            except CompileSymbolError:
+                break
+
+        self.write_non_terminal_end(current_element)
+        return count
+
+    def subroutine_call(self, qualifier=None):
+        """subroutineCall: subroutineName '(' expressionList ')' | (className | varName) '.' subroutineName '(' expressionList ')'"""
+
+        f = self._infile
+
+        try:
+            name = self.add_identifier('subroutine name | class name | variable name')
+            self.add_symbols(['(', '.'])
+            self.write_body()
+            if f.token_type() == token_types.SYMBOL:
+                if f.symbol() == '(':
+                    arguments = yield self.expression_list()
+                    self.add_symbols([')'])
+                    if qualifier is not None and self._os_subroutines:
+                        self.check_os_call(qualifier, name, arguments)
+                elif f.symbol() == '.':
+                    yield self.subroutine_call(name)
+        except CompileError as ex:
+            raise CompileSubroutineCallError("Expected a complete subroutine call") from ex
+
+
+if __name__ == "__main__":
+    import io
+    import random
+    import sys
+
+    from parser.jack_tokenizer import JackTokenizer
+    from parser.emitters import RecordingEmitter
+
+    def compile_source(engine_class, source):
+        recorder = RecordingEmitter()
+        engine_class(JackTokenizer(io.StringIO(source)), recorder).compile_class()
+        return recorder.events
+
+    def nested_class(depth):
+        expression = '(' * depth + 'x' + ' + 1)' * depth
+        statements = 'if (x) { ' * depth + 'let x = -~-x;' + ' }' * depth
+        return ('class Deep { function int f(int x) { let x = ' + expression + '; ' + statements +
+                ' return f(x[g(1, ' + expression + ')]); } }')
+
+    # identical to the recursive engine where that one still works.
+    for depth in [0, 1, 2, 10, 100]:
+        source = nested_class(depth)
+        assert compile_source(IterativeCompilationEngine, source) == compile_source(CompilationEngine, source)
+
+    try:
+        compile_source(CompilationEngine, nested_class(10000))
+        raise AssertionError("expected the recursive engine to run out of stack")
+    except RecursionError:
+        pass
+
+    for depth in [10000, 20000]:
+        events = compile_source(IterativeCompilationEngine, nested_class(depth))
+        assert sum(event[0] == 'write_non_terminal_start' for event in events) > 6 * depth
+        assert events[-1] == ('write_non_terminal_end', 'class')
+
+    def compile_result(engine_class, source):
+        try:
+            return compile_source(engine_class, source), None
+        except CompileError as ex:
+            return None, str(ex)
+
+    # errors are reported in the same way, and code one accepts the other does too.
+    bad_source = nested_class(10).replace('let x = -~-x;', 'let x = -~-x')
+    result = compile_result(CompilationEngine, bad_source)
+    assert result[1] is not None and result == compile_result(IterativeCompilationEngine, bad_source), result
+    # a rule that catches an error thrown into it and returns must not see it again in its caller.
+    source = 'class C { function void f() { let x = f(a[1); return; } }'
+    assert compile_result(IterativeCompilationEngine, source) == compile_result(CompilationEngine, source)
+    # a truncated class is an error, not the end of the tokenizer's iteration.
+    source = 'class A { function void f() { return; }'
+    result = compile_result(CompilationEngine, source)
+    assert result[1] is not None and result == compile_result(IterativeCompilationEngine, source), result
+
+    # random edits of a class touching every nested rule.
+    random_ = random.Random(0)
+    good_source = nested_class(3)
+    edits = ['(', ')', '[', ']', '{', '}', ';', ',', '.', '=', '+', '-', '~', 'x', 'f(', 'let', 'do', 'if', 'return']
+    for _ in range(1000):
+        source = good_source
+        for _ in range(random_.randint(1, 3)):
+            at = random_.randrange(len(source))
+            source = source[:at] + random_.choice(edits) + source[at + random_.randint(0, 3):]
+        assert compile_result(IterativeCompilationEngine, source) == compile_result(CompilationEngine, source), source
+
+    print("ok", file=sys.stderr)
@@ -1,7 +1,18 @@
+import codecs
+import io
 import itertools
+import types
 
 from .utils import token_types
 from .utils import patterns
+from . import vector_lexer
+from .limits import Governor
+from .utils.exceptions import CompileEndOfInputError
+
+# chunk size used when offsets or limits need the chunked reader and no chunk size is given.
+DEFAULT_CHUNK_SIZE = 1 << 16
+# distinct tokens `token_cache` keeps across `reset()`s before it starts over.
+TOKEN_CACHE_SIZE = 1 << 16
 
 
 class JackTokenizer:
@@ -9,10 +20,15 @@ class JackTokenizer:
 
     Tokenizing, a basic service of any syntax analyzer, is the act of breaking a given textual input into a stream of tokens. And while it is at it, the tokenizer can also classify the tokens into lexical categories. With that in mind, your first task it to implement, and test, the JackTokenizer module specified in chapter 10. Specifically, you have to develop (i) a Tokenizer implementation, and (ii) a test program that goes through a given input file (.jack file) and produces a stream of tokens using your Tokenizer implementation. Each token should be printed in a separate line, along with its classification: symbol, keyword, identifier, integer constant or string constant.
 
+    Instances share nothing mutable, the tables below are read only, so
+    tokenizers in different threads don't need any locking.
 
+    A tokenizer is a context manager that `close()`s its source on exit,
+    and `reset()` points it at the next source, so one tokenizer can read
+    many files with a warm `token_cache`.
     """
 
-    KEYWORDS_TABLE = {
+    KEYWORDS_TABLE = types.MappingProxyType({
         'class': token_types.CLASS,
         'method': token_types.METHOD,
         'function': token_types.FUNCTION,
@@ -34,9 +50,9 @@ class JackTokenizer:
         'false': token_types.FALSE,
         'null': token_types.NULL,
         'this': token_types.THIS,
-    }
+    })
 
-    NAMES_TABLE = {
+    NAMES_TABLE = types.MappingProxyType({
         token_types.TOKEN_TYPE: 'token_type',
         token_types.KEYWORD: 'keyword',
         token_types.SYMBOL: 'symbol',
@@ -64,29 +80,105 @@ class JackTokenizer:
         token_types.FALSE: 'false',
         token_types.NULL: 'null',
         token_types.THIS: 'this',
-    }
+    })
 
-    XML_ESCAPES = {
+    XML_ESCAPES = types.MappingProxyType({
         '&': '&amp;',
         '<': '&lt;',
         '>': '&gt;',
-    }
+    })
 
-    def __init__(self, file):
+    def __init__(self, file, chunk_size=None, vectorized=None, record_offsets=False, limits=None):
         """Opens the input file and gets ready to parse it.
 
+        `file` is a path, an already open text or binary (utf-8) stream or
+        the bytes of a source. Only a file opened here is closed at the end.
+        If `chunk_size` is given the file is streamed `chunk_size` characters
+        at a time instead of line by line, so memory use stays bounded no
+        matter how big the input is, whether or not numpy is installed.
+        Otherwise, when numpy is installed (or `vectorized` is True), the
+        whole file is lexed at once by `vector_lexer`; pass False to read it
+        line by line instead.
+        With `record_offsets` the (start, end) character offsets of every
+        token in the source are appended to `offsets` as it is read. The
+        line reader loses offsets, so the file is then read in chunks
+        unless the vectorized lexer is used.
+        `limits` are `Limits` to enforce while compiling untrusted input:
+        the source is then always read in chunks and `governor` counts what
+        is read, see `Governor`.
+
         `token_cache` with look like:
         {"example_token":
             {"token_type": 4, "string_val": "example_string"}}
         OR
         {"example_token":
             {"token_type": 0, "keyword": "example_keyword"}}
+
+        Tokens are read lazily, one line (or chunk) at a time, except
+        by the vectorized lexer.
+        """
+        self._chunk_size = chunk_size
+        self._vectorized = vectorized
+        self._record_offsets = record_offsets
+        self._limits = limits
+        self._owned_file = None
+        self.token_cache = {}
+        self.reset(file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the source if it was opened here, no more tokens are read. Safe to call again."""
+        self.more_tokens = False
+        if self._owned_file is not None:
+            self._owned_file.close()
+            self._owned_file = None
+
+    def reset(self, file):
+        """Close the current source and get ready to parse `file`, as given to `__init__()`.
+
+        The options are kept, and so is `token_cache` unless it has grown past
+        `TOKEN_CACHE_SIZE` tokens. `offsets` and `governor` start over.
         """
-        self.fd = open(file)
+        self.close()
+        if len(self.token_cache) > TOKEN_CACHE_SIZE:
+            self.token_cache.clear()
+        chunk_size, vectorized, record_offsets, limits = (
+            self._chunk_size, self._vectorized, self._record_offsets, self._limits)
+
+        if isinstance(file, (bytes, bytearray, memoryview)):
+            file = io.StringIO(bytes(file).decode())
+        elif hasattr(file, 'read') and isinstance(file.read(0), bytes):
+            file = codecs.getreader('utf-8')(file)
+        if not hasattr(file, 'read'):
+            file = self._owned_file = open(file)
+        self.fd = file
+        self.chunk_size = chunk_size
         self.token = ""
         self._next_token = ""
-        self.token_queue = []  # first in first out (fifo) queue
-        self.token_cache = {}
+        self.offsets = [] if record_offsets else None
+        self.governor = Governor(limits, self.fd) if limits else None
+        if self.governor is not None:
+            self.fd = self.governor
+        vectorized = not chunk_size and not limits and (
+            vectorized or vectorized is None and vector_lexer.numpy is not None)
+        if (record_offsets or limits) and not vectorized:
+            self.chunk_size = chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+        # first in first out (fifo) queue of token strings
+        if chunk_size:
+            self.token_queue = self.next_chunked_token()
+        elif vectorized:
+            self.token_queue = self.next_vectorized_token()
+        else:
+            self.token_queue = (match.group(0) for match in itertools.chain.from_iterable(
+                patterns.ALL_TERMINATORS.finditer(line) for line in self.next_clean_line()))
+        if self.governor is not None:
+            self.governor.queue = self.token_queue
+            self.token_queue = self.governor
         self.more_tokens = True
         self.line_number = 1
 
@@ -127,6 +219,112 @@ class JackTokenizer:
             if line:
                 yield line
 
+    def next_chunked_token(self):
+        """Yield terminators, reading the input in fixed size chunks.
+
+        Only the unread tail of the current chunk is kept between reads, so
+        a token, string or comment may cross a chunk boundary. Memory stays
+        bounded by `chunk_size` and the longest token.
+        A match that touches the end of the buffer might continue in the
+        next chunk, so it is only yielded once more input has been read.
+        Comment bodies are dropped as they are read, even huge ones.
+        """
+
+        buffer = ""
+        pos = 0
+        consumed = 0  # characters dropped from the front of the buffer.
+        offsets = self.offsets
+        eof = False
+        need_more = False
+        comment_end = None  # '*/' or newline while inside a comment.
+
+        while True:
+            if need_more or pos >= len(buffer):
+                if eof:
+                    return
+                # a token longer than a chunk is matched again from its start on every read: read as much
+                # again as is left over, so the reads of one token add up to linear time.
+                chunk = self.fd.read(max(self.chunk_size, len(buffer) - pos))
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                consumed += pos
+                pos = 0
+                need_more = False
+                continue
+
+            if comment_end:
+                end = buffer.find(comment_end, pos)
+                if end == -1:
+                    # keep a trailing '*' as it might start the '*/'.
+                    pos = max(pos, len(buffer) - len(comment_end) + 1)
+                    need_more = True
+                else:
+                    pos = end + len(comment_end)
+                    comment_end = None
+                continue
+
+            char = buffer[pos]
+            if char.isspace():
+                pos = patterns.WHITESPACE.match(buffer, pos).end()
+                continue
+            if char == '/':
+                if pos + 1 == len(buffer) and not eof:
+                    need_more = True  # might be the start of a comment.
+                    continue
+                if buffer.startswith('/*', pos):
+                    comment_end = '*/'
+                    pos += 2
+                    continue
+                if buffer.startswith('//', pos):
+                    comment_end = '\n'
+                    pos += 2
+                    continue
+
+            match = patterns.ALL_TERMINATORS.match(buffer, pos)
+            if not eof:
+                if match and match.end() == len(buffer):
+                    need_more = True  # token might continue in the next chunk.
+                    continue
+                if not match and char == '"' and buffer.find('\n', pos) == -1:
+                    need_more = True  # string might end in the next chunk.
+                    continue
+
+            if match:
+                pos = match.end()
+                if offsets is not None:
+                    offsets.append((consumed + match.start(), pos + consumed))
+                yield match.group(0)
+            else:
+                pos += 1  # not a terminator, skip it like `finditer` does.
+
+    def next_vectorized_token(self):
+        """Yield terminators found by the numpy lexer, `vector_lexer`.
+
+        It reads the whole file at once and follows the comment and string
+        rules of `next_chunked_token()`, which also lexes the few sources
+        the numpy lexer can't. The types it finds go into `token_cache`.
+        """
+
+        text = self.fd.read()
+        tokens = vector_lexer.tokenize(text)
+        if tokens is None:
+            self.fd = io.StringIO(text)
+            self.chunk_size = len(text) + 1
+            yield from self.next_chunked_token()
+            return
+
+        kinds, starts, ends = tokens
+        starts, ends = starts.tolist(), ends.tolist()
+        if self.offsets is not None:
+            self.offsets.extend(zip(starts, ends))
+        lexemes = list(map(text.__getitem__, map(slice, starts, ends)))
+        # the lexer knows every token's type, so `token_type()` never has to match it.
+        token_cache = self.token_cache
+        for lexeme, kind in dict(zip(lexemes, kinds.tolist())).items():
+            if lexeme not in token_cache:
+                token_cache[lexeme] = {"token_type": kind}
+        yield from lexemes
+
     def advance(self):
         """Gets the next token from input and makes it the current token.
 
@@ -139,22 +337,17 @@ class JackTokenizer:
         """
 
         if self.has_more_tokens():
-            for line in self.next_clean_line():
-                # These 2 lines do ALL the work!
-                tokens = patterns.ALL_TERMINATORS.finditer(line)
-                self.token_queue = itertools.chain(self.token_queue, tokens)
             # import pdb;pdb.set_trace()
             try:
-                self.token = self._next_token or next(self.token_queue).group(0)
+                self.token = self._next_token or next(self.token_queue)
                 self.line_number += 1
-                self._next_token = next(self.token_queue).group(0)
+                self._next_token = next(self.token_queue)
             except StopIteration:
                 self._next_token = ''
             if not self._next_token:
-                self.more_tokens = False
-                self.fd.close()
+                self.close()
         else:
-            raise StopIteration("No more tokens")
+            raise CompileEndOfInputError("Unexpected end of input")
 
     def token_type(self):
         """Returns the type of the current token.
@@ -199,7 +392,7 @@ class JackTokenizer:
                 pass
 
             type_ = self.KEYWORDS_TABLE[self.token]
-            self.token_cache[self.token] = {"key_word": type_}
+            self.token_cache[self.token]["key_word"] = type_
             return type_
         else:
             raise TypeError("'token_type()' is not KEYWORD.")
@@ -218,7 +411,7 @@ class JackTokenizer:
                 pass
 
             valid_xml_char = self.XML_ESCAPES[self.token] if self.token in self.XML_ESCAPES else self.token
-            self.token_cache[self.token] = {"symbol": valid_xml_char}
+            self.token_cache[self.token]["symbol"] = valid_xml_char
             return valid_xml_char
         else:
             raise TypeError("'token_type()' is not SYMBOL.")
@@ -236,7 +429,7 @@ class JackTokenizer:
             except KeyError:
                 pass
 
-            self.token_cache[self.token] = {"identifier": self.token}
+            self.token_cache[self.token]["identifier"] = self.token
             return self.token
         else:
             raise TypeError("'token_type()' is not IDENTIFIER.")
@@ -255,7 +448,7 @@ class JackTokenizer:
                 pass
 
             int_val_token = int(self.token)
-            self.token_cache[self.token] = {"int_val": int_val_token}
+            self.token_cache[self.token]["int_val"] = int_val_token
             return int_val_token
         else:
             raise TypeError("'token_type()' is not INT_CONST.")
@@ -275,7 +468,7 @@ class JackTokenizer:
                 pass
 
             string_val_token = self.token[1:-1]
-            self.token_cache[self.token] = {"string_val": string_val_token}
+            self.token_cache[self.token]["string_val"] = string_val_token
             return string_val_token
         else:
             raise TypeError("'token_type()' is not STRING_CONST.")
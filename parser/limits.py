@@ -0,0 +1,159 @@
+import contextlib
+import os
+import signal
+import time
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not on Windows
+    resource = None
+
+from parser.utils.exceptions import (
+    CompileSourceSizeError,
+    CompileTokenLimitError,
+    CompileNestingError,
+    CompileTimeLimitError,
+    CompileMemoryLimitError,
+)
+
+CHECK_EVERY = 256  # tokens read between time and memory checks.
+HARD_LIMIT_GRACE = 1.0  # seconds a worker gets past its time limit before it is killed.
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def memory_usage(field=1):
+    """The resident (field 1) or virtual (field 0) memory of this process in bytes.
+
+    Read from /proc, elsewhere the peak resident memory is the best cheap guess.
+    """
+    try:
+        with open('/proc/self/statm') as statm_f:
+            return int(statm_f.read().split()[field]) * PAGE_SIZE
+    except OSError:
+        if resource is None:
+            return 0
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Limits:
+    """Resource limits for compiling one source, None is unlimited.
+
+    `source_bytes` and `tokens` cap the input, `depth` the nesting of
+    non-terminals, `seconds` the wall-clock time and `memory` how many
+    bytes resident memory may grow by during the compile.
+    """
+
+    def __init__(self, source_bytes=None, tokens=None, depth=None, seconds=None, memory=None):
+        self.source_bytes = source_bytes
+        self.tokens = tokens
+        self.depth = depth
+        self.seconds = seconds
+        self.memory = memory
+
+    def __bool__(self):
+        return any(limit is not None for limit in
+                   (self.source_bytes, self.tokens, self.depth, self.seconds, self.memory))
+
+    def __repr__(self):
+        return "Limits(source_bytes={}, tokens={}, depth={}, seconds={}, memory={})".format(
+            self.source_bytes, self.tokens, self.depth, self.seconds, self.memory)
+
+
+class Governor:
+    """Enforces `Limits` on one compile, cooperatively.
+
+    A `JackTokenizer` reads its source through `read()` and its tokens
+    through the governor (it is an iterator over `queue`), and the engine
+    calls `enter()` and `exit()` around every non-terminal. Time and memory
+    are checked every `CHECK_EVERY` tokens and on every read.
+
+    The engine catches errors to try alternatives, so the first violation
+    is kept in `error` and raised again on every later read until the
+    compile gives up.
+    """
+
+    def __init__(self, limits, fd):
+        self.limits = limits
+        self.error = None
+        self.queue = None  # the tokens to govern, set by the tokenizer.
+        self._fd = fd
+        self._bytes = 0
+        self._tokens = 0
+        self._depth = 0
+        self._deadline = None if limits.seconds is None else time.monotonic() + limits.seconds
+        self._memory_base = None if limits.memory is None else memory_usage()
+
+    def fail(self, error):
+        if self.error is None:
+            self.error = error
+        raise self.error
+
+    def check(self):
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            self.fail(CompileTimeLimitError("Compile took longer than {} seconds".format(self.limits.seconds)))
+        if self._memory_base is not None and memory_usage() - self._memory_base > self.limits.memory:
+            self.fail(CompileMemoryLimitError("Compile used more than {} bytes of memory".format(self.limits.memory)))
+
+    def read(self, size):
+        if self.error is not None:
+            raise self.error
+        chunk = self._fd.read(size)
+        self._bytes += len(chunk) if chunk.isascii() else len(chunk.encode())
+        if self.limits.source_bytes is not None and self._bytes > self.limits.source_bytes:
+            self.fail(CompileSourceSizeError("Source is larger than {} bytes".format(self.limits.source_bytes)))
+        self.check()
+        return chunk
+
+    def close(self):
+        self._fd.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.error is not None:
+            raise self.error
+        token = next(self.queue)
+        self._tokens += 1
+        if self.limits.tokens is not None and self._tokens > self.limits.tokens:
+            self.fail(CompileTokenLimitError("Source has more than {} tokens".format(self.limits.tokens)))
+        if not self._tokens % CHECK_EVERY:
+            self.check()
+        return token
+
+    def enter(self):
+        self._depth += 1
+        if self.limits.depth is not None and self._depth > self.limits.depth:
+            self.fail(CompileNestingError("Nesting is deeper than {}".format(self.limits.depth)))
+
+    def exit(self):
+        self._depth -= 1
+
+
+@contextlib.contextmanager
+def hard_limits(limits):
+    """Kill this process if a compile gets far past `limits.seconds` or `limits.memory`.
+
+    Only for worker processes compiling one untrusted file at a time, where
+    the cooperative checks of `Governor` are the first line of defence.
+    Time is capped with SIGALRM, whose default action ends the process, and
+    memory with RLIMIT_AS, which makes allocations raise MemoryError.
+    """
+
+    if limits.seconds is not None:
+        signal.signal(signal.SIGALRM, signal.SIG_DFL)
+        signal.setitimer(signal.ITIMER_REAL, limits.seconds + HARD_LIMIT_GRACE)
+    old_limit = None
+    if limits.memory is not None and resource is not None:
+        old_limit = resource.getrlimit(resource.RLIMIT_AS)
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_usage(0) + 2 * limits.memory, old_limit[1]))
+        except ValueError:
+            old_limit = None  # the hard limit is already lower.
+    try:
+        yield
+    finally:
+        if limits.seconds is not None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        if old_limit is not None:
+            resource.setrlimit(resource.RLIMIT_AS, old_limit)
@@ -0,0 +1,318 @@
+import functools
+import os
+import re
+import types
+
+from parser.emitters import Emitter, XmlEmitter, NullEmitter
+from parser.utils import token_types
+from parser.utils.exceptions import CompileError
+
+GRAMMAR_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jack.grammar')
+
+# grammar terminals matched by token kind instead of by lexeme.
+TOKEN_KINDS = {
+    'identifier': token_types.IDENTIFIER,
+    'integerConstant': token_types.INT_CONST,
+    'stringConstant': token_types.STRING_CONST,
+}
+
+# a 'quoted' lexeme, an alternative separator or a name.
+GRAMMAR_SYMBOL = re.compile(r"'[^']+'|\||[^\s|]+")
+
+EMPTY = ''  # in a FIRST set, the rule can match nothing.
+END = 0  # lookahead at the end of the input, token types start at 1.
+
+# parse stack actions
+MATCH, EXPAND, CLOSE = range(3)
+
+
+class Grammar:
+    """An LL(1) parse table built from a declarative grammar, see jack.grammar.
+
+    Lookahead keys are the lexeme of keywords and symbols and the token kind
+    (a `token_types` value) of identifiers and constants.
+    `table[rule][lookahead]` is (element, actions): the xml element the rule
+    writes (None for '_' rules) and the stack actions of the chosen
+    alternative, already reversed so they can be pushed in one go.
+    """
+
+    def __init__(self, text, start='class'):
+        self.start = start
+        self.rules = self.parse_rules(text)  # rule: [[symbol, ...], ...]
+        self.first = {rule: set() for rule in self.rules}
+        self.follow = {rule: set() for rule in self.rules}
+        self.table = {rule: {} for rule in self.rules}
+
+        self.compute_first()
+        self.compute_follow()
+        self.build_table()
+
+    @classmethod
+    def load(cls, path=GRAMMAR_FILE):
+        with open(path) as grammar_f:
+            return cls(grammar_f.read())
+
+    @staticmethod
+    def parse_rules(text):
+        rules = {}
+        rule = None
+        for line in text.splitlines():
+            line = line.split('#')[0].strip()
+            if not line:
+                continue
+            if line.startswith('|'):
+                symbols = GRAMMAR_SYMBOL.findall(line)
+            else:
+                rule, _, right = line.partition('=')
+                rule = rule.strip()
+                if rule in rules:
+                    raise ValueError("Rule {} is defined twice".format(rule))
+                rules[rule] = [[]]
+                symbols = GRAMMAR_SYMBOL.findall(right)
+            for symbol in symbols:
+                if symbol == '|':
+                    rules[rule].append([])
+                else:
+                    rules[rule][-1].append(symbol)
+        return rules
+
+    def key(self, symbol):
+        """The lookahead key of a terminal grammar symbol."""
+        if symbol[0] == "'":
+            return symbol[1:-1]
+        if symbol in TOKEN_KINDS:
+            return TOKEN_KINDS[symbol]
+        raise ValueError("Unknown grammar symbol {}".format(symbol))
+
+    def first_of(self, symbols):
+        """The FIRST set of a sequence of grammar symbols."""
+        result = set()
+        for symbol in symbols:
+            if symbol not in self.rules:
+                result.add(self.key(symbol))
+                return result
+            result |= self.first[symbol] - {EMPTY}
+            if EMPTY not in self.first[symbol]:
+                return result
+        result.add(EMPTY)
+        return result
+
+    def compute_first(self):
+        changed = True
+        while changed:
+            changed = False
+            for rule, alternatives in self.rules.items():
+                for alternative in alternatives:
+                    first = self.first_of(alternative)
+                    if not first <= self.first[rule]:
+                        self.first[rule] |= first
+                        changed = True
+
+    def compute_follow(self):
+        self.follow[self.start].add(END)
+        changed = True
+        while changed:
+            changed = False
+            for rule, alternatives in self.rules.items():
+                for alternative in alternatives:
+                    for index, symbol in enumerate(alternative):
+                        if symbol not in self.rules:
+                            continue
+                        follow = self.first_of(alternative[index + 1:])
+                        if EMPTY in follow:
+                            follow = follow - {EMPTY} | self.follow[rule]
+                        if not follow <= self.follow[symbol]:
+                            self.follow[symbol] |= follow
+                            changed = True
+
+    def build_table(self):
+        for rule, alternatives in self.rules.items():
+            element = None if rule.startswith('_') else rule
+            for alternative in alternatives:
+                actions = [(CLOSE, element)] if element else []
+                for symbol in reversed(alternative):
+                    if symbol in self.rules:
+                        actions.append((EXPAND, symbol))
+                    else:
+                        actions.append((MATCH, self.key(symbol)))
+
+                lookaheads = self.first_of(alternative)
+                if EMPTY in lookaheads:
+                    lookaheads = lookaheads - {EMPTY} | self.follow[rule]
+                for lookahead in lookaheads:
+                    if lookahead in self.table[rule]:
+                        raise ValueError("Grammar is not LL(1): {} has two alternatives for {!r}".format(rule, lookahead))
+                    self.table[rule][lookahead] = (element, tuple(actions))
+
+
+@functools.lru_cache()
+def jack_grammar():
+    """The Jack grammar, built on first use."""
+    return Grammar.load()
+
+
+class LL1CompilationEngine:
+    """A table-driven parser for Jack.
+
+    Parses with a single loop over an explicit stack and the LL(1) table of
+    `jack_grammar()`, instead of one method per grammar rule, and writes the
+    same output as `CompilationEngine` for any valid class.
+    Errors are raised as a `CompileError` naming the expected tokens.
+    """
+
+    # token kind: xml terminal element
+    TERMINALS = types.MappingProxyType({
+        token_types.KEYWORD: 'keyword',
+        token_types.SYMBOL: 'symbol',
+        token_types.IDENTIFIER: 'identifier',
+        token_types.INT_CONST: 'integerConstant',
+        token_types.STRING_CONST: 'stringConstant',
+    })
+
+    def __init__(self, infile, outfile, checks=(), outline=False, grammar=None):
+        """Creates a new table-driven engine with the given input and output.
+
+        `outfile` is either an `Emitter`, a stream to write xml to or None to
+        only check the syntax. Semantic `checks` and `outline` mode are not supported by this engine.
+        Resource limits are given to the tokenizer, see `CompilationEngine`.
+        """
+        if checks:
+            raise ValueError("The table-driven engine does not do semantic checks.")
+        if outline:
+            raise ValueError("The table-driven engine has no outline mode.")
+        self.checks = frozenset()
+        self.semantic_errors = []
+        self._infile = infile
+        self._set_output(outfile)
+        self._grammar = grammar or jack_grammar()
+        self._governor = getattr(infile, 'governor', None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the tokenizer, see `CompilationEngine.close()`."""
+        self._infile.close()
+
+    def reset(self, source, outfile=None):
+        """Get ready to compile another class, see `CompilationEngine.reset()`."""
+        self._infile.reset(source)
+        if outfile is not None:
+            self._set_output(outfile)
+        self._governor = getattr(self._infile, 'governor', None)
+
+    def _set_output(self, outfile):
+        if outfile is None:
+            outfile = NullEmitter()
+        self._emitter = outfile if isinstance(outfile, Emitter) else XmlEmitter(outfile)
+
+    def compile_class(self):
+        """Compiles a complete class."""
+
+        f = self._infile
+        table = self._grammar.table
+        emitter = self._emitter
+        write_terminal = emitter.write_terminal
+        terminals = self.TERMINALS
+        escapes = f.XML_ESCAPES
+        keyword, symbol = token_types.KEYWORD, token_types.SYMBOL
+        int_const, string_const = token_types.INT_CONST, token_types.STRING_CONST
+
+        governor = self._governor
+        stack = [(EXPAND, self._grammar.start)]
+        pop = stack.pop
+        push = stack.extend
+        lookahead = None  # the current token has not been read yet.
+        kind = lexeme = None
+
+        while stack:
+            action, argument = pop()
+            if action == CLOSE:
+                emitter.write_non_terminal_end(argument)
+                if governor is not None:
+                    governor.exit()
+                continue
+
+            if lookahead is None:
+                if f.has_more_tokens():
+                    f.advance()
+                    lexeme = f.token
+                    kind = f.token_type()
+                    # unknown tokens (kind None) are keyed by lexeme too, so they never match.
+                    lookahead = kind if kind in terminals and kind != keyword and kind != symbol else lexeme
+                else:
+                    lookahead = END
+                    kind = lexeme = None  # not the last token's, it was matched already.
+
+            if action == EXPAND:
+                try:
+                    element, actions = table[argument][lookahead]
+                except KeyError:
+                    raise CompileError(self.expected(table[argument], argument, lexeme),
+                                       expected=self.token_names(table[argument]))
+                if element:
+                    if governor is not None:
+                        governor.enter()
+                    emitter.write_non_terminal_start(element)
+                push(actions)
+            elif lookahead == argument:
+                if kind == symbol:
+                    value = escapes.get(lexeme, lexeme)
+                elif kind == int_const:
+                    value = int(lexeme)
+                elif kind == string_const:
+                    value = lexeme[1:-1]
+                else:
+                    value = lexeme
+                write_terminal(terminals[kind], value)
+                lookahead = None
+            else:
+                raise CompileError(self.expected({argument: None}, None, lexeme), expected=self.token_names([argument]))
+
+    @staticmethod
+    def token_names(lookaheads):
+        """The sorted names of lookahead keys, as in `CompileError.expected`."""
+        names = {kind: name for name, kind in TOKEN_KINDS.items()}
+        names[END] = 'end of input'
+        return sorted(names.get(key, key) for key in lookaheads)
+
+    @staticmethod
+    def expected(lookaheads, rule, lexeme):
+        names = {kind: name for name, kind in TOKEN_KINDS.items()}
+        names[END] = 'end of input'
+        expected = "| ".join(sorted(
+            names[key] if key in names else "'{}'".format(key) for key in lookaheads))
+        message = "Expected {}".format(expected)
+        if rule:
+            message += " in {}".format(rule.lstrip('_'))
+        if not lexeme:  # None at the end of input, '' is the only token of an empty source.
+            return message + ", got end of input"
+        return message + ", got '{}'".format(lexeme)
+
+
+if __name__ == "__main__":
+    # benchmark against the recursive engine: python -m parser.ll1_engine file.jack ...
+    import io
+    import sys
+    import timeit
+
+    from parser.jack_tokenizer import JackTokenizer
+    from parser.compilation_engine import CompilationEngine
+
+    sources = {path: open(path).read() for path in sys.argv[1:]}
+
+    def compile_all(engine_class):
+        outputs = []
+        for source in sources.values():
+            out = io.StringIO()
+            engine_class(JackTokenizer(io.StringIO(source)), out).compile_class()
+            outputs.append(out.getvalue())
+        return outputs
+
+    assert compile_all(LL1CompilationEngine) == compile_all(CompilationEngine), "outputs differ"
+    for engine_class in [CompilationEngine, LL1CompilationEngine]:
+        best = min(timeit.repeat(lambda: compile_all(engine_class), number=10, repeat=5)) / 10
+        print("{:<22} {:.4f}s per run".format(engine_class.__name__, best))
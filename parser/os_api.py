@@ -0,0 +1,80 @@
+"""The subroutines of the standard Jack OS, to check calls of them without its sources.
+
+Transcribed from the OS API of the nand2tetris book (appendix 6), so a
+compile never reads or parses OS class sources. The engines import this
+module on first use, only when the `os_calls` semantic check is on.
+"""
+import types
+
+FUNCTION = 'function'
+METHOD = 'method'
+CONSTRUCTOR = 'constructor'
+
+# class name: {subroutine name: (kind, number of parameters)}, methods don't count `this`.
+OS_SUBROUTINES = types.MappingProxyType({
+    'Math': {
+        'init': (FUNCTION, 0),
+        'abs': (FUNCTION, 1),
+        'multiply': (FUNCTION, 2),
+        'divide': (FUNCTION, 2),
+        'min': (FUNCTION, 2),
+        'max': (FUNCTION, 2),
+        'sqrt': (FUNCTION, 1),
+    },
+    'String': {
+        'new': (CONSTRUCTOR, 1),
+        'dispose': (METHOD, 0),
+        'length': (METHOD, 0),
+        'charAt': (METHOD, 1),
+        'setCharAt': (METHOD, 2),
+        'appendChar': (METHOD, 1),
+        'eraseLastChar': (METHOD, 0),
+        'intValue': (METHOD, 0),
+        'setInt': (METHOD, 1),
+        'backSpace': (FUNCTION, 0),
+        'doubleQuote': (FUNCTION, 0),
+        'newLine': (FUNCTION, 0),
+    },
+    'Array': {
+        'new': (FUNCTION, 1),
+        'dispose': (METHOD, 0),
+    },
+    'Output': {
+        'init': (FUNCTION, 0),
+        'moveCursor': (FUNCTION, 2),
+        'printChar': (FUNCTION, 1),
+        'printString': (FUNCTION, 1),
+        'printInt': (FUNCTION, 1),
+        'println': (FUNCTION, 0),
+        'backSpace': (FUNCTION, 0),
+    },
+    'Screen': {
+        'init': (FUNCTION, 0),
+        'clearScreen': (FUNCTION, 0),
+        'setColor': (FUNCTION, 1),
+        'drawPixel': (FUNCTION, 2),
+        'drawLine': (FUNCTION, 4),
+        'drawRectangle': (FUNCTION, 4),
+        'drawCircle': (FUNCTION, 3),
+    },
+    'Keyboard': {
+        'init': (FUNCTION, 0),
+        'keyPressed': (FUNCTION, 0),
+        'readChar': (FUNCTION, 0),
+        'readLine': (FUNCTION, 1),
+        'readInt': (FUNCTION, 1),
+    },
+    'Memory': {
+        'init': (FUNCTION, 0),
+        'peek': (FUNCTION, 1),
+        'poke': (FUNCTION, 2),
+        'alloc': (FUNCTION, 1),
+        'deAlloc': (FUNCTION, 1),
+    },
+    'Sys': {
+        'init': (FUNCTION, 0),
+        'halt': (FUNCTION, 0),
+        'error': (FUNCTION, 1),
+        'wait': (FUNCTION, 1),
+    },
+})
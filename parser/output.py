@@ -0,0 +1,175 @@
+"""Write output files atomically, committing them in batches.
+
+Every output is written to a temp file in the directory of the real one,
+and only renamed over it once all the outputs of its source are complete,
+so an interrupted run or a syntax error never leaves a truncated output
+behind: the previous one, if any, stays as it was. An output with the same
+bytes as the file already there is not renamed at all, so its mtime stays
+put and incremental tools downstream don't rebuild it.
+
+Renames are done `batch_size` at a time, then each directory they touched
+is fsynced once, rather than paying a metadata round trip per file, which
+is what costs on network filesystems.
+
+    with OutputCommitter() as committer:
+        for source in sources:
+            with committer.outputs() as outputs:
+                out_f = outputs.open('Main.test.xml', 'w')
+                ...
+"""
+import itertools
+import os
+import threading
+
+BATCH_SIZE = 256  # outputs renamed between directory fsyncs.
+TEMP_SUFFIX = '.tmp'
+COMPARE_BLOCK = 1 << 16  # bytes read at a time comparing an output with the existing file.
+
+
+def same_bytes(path, size, other_path):
+    """Does the file at `other_path` hold exactly the `size` bytes of `path`? False if it doesn't exist."""
+    try:
+        if os.path.getsize(other_path) != size:
+            return False
+        with open(path, 'rb') as in_f, open(other_path, 'rb') as other_f:
+            while True:
+                block = in_f.read(COMPARE_BLOCK)
+                if block != other_f.read(COMPARE_BLOCK):
+                    return False
+                if not block:
+                    return True
+    except FileNotFoundError:
+        return False
+
+
+def sync_directory(directory):
+    """Make the renames done in `directory` durable, where directories can be fsynced."""
+    try:
+        fd = os.open(directory, os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0))
+    except OSError:  # eg: Windows, where directories can't be opened.
+        return
+    try:
+        os.fsync(fd)
+    except OSError:  # some filesystems can't sync a directory.
+        pass
+    finally:
+        os.close(fd)
+
+
+class OutputCommitter:
+    """Commits the outputs of many sources with batched atomic renames.
+
+    Outputs are staged by `outputs()` and renamed into place by `commit()`,
+    called every `batch_size` outputs and on leaving a with block. With
+    `sync`, every output is fsynced before its rename and directories after,
+    so a crash can't leave an empty file where a complete output was renamed.
+    Outputs may be staged from several threads at once.
+    `written` and `unchanged` count the outputs renamed and left alone.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, sync=True):
+        self.batch_size = batch_size
+        self.sync = sync
+        self.written = 0
+        self.unchanged = 0
+        self._pending = []  # (temp path, path) to rename.
+        self._temp_ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        # the outputs staged so far are complete, even if the run was interrupted.
+        self.commit()
+
+    def outputs(self):
+        """The outputs of one source, see `OutputSet`."""
+        return OutputSet(self)
+
+    def commit(self):
+        """Rename every staged output into place."""
+        with self._lock:
+            self._rename_pending()
+
+    def temp_path(self, path):
+        """A new temp file name next to `path`, hidden and unique to this process."""
+        directory, base_name = os.path.split(path)
+        with self._lock:
+            temp_id = next(self._temp_ids)
+        return os.path.join(directory, '.{}.{}-{}{}'.format(base_name, os.getpid(), temp_id, TEMP_SUFFIX))
+
+    def stage(self, renames, unchanged=()):
+        """Stage the (temp path, path) `renames` of a source, and delete the temp paths of its `unchanged` outputs."""
+        for temp_path in unchanged:
+            os.unlink(temp_path)
+        with self._lock:
+            self.unchanged += len(unchanged)
+            self._pending.extend(renames)
+            if len(self._pending) >= self.batch_size:
+                self._rename_pending()
+
+    def _rename_pending(self):
+        pending, self._pending = self._pending, []
+        directories = set()
+        for temp_path, path in pending:
+            os.replace(temp_path, path)
+            directories.add(os.path.dirname(path) or os.curdir)
+        if self.sync:
+            for directory in directories:
+                sync_directory(directory)
+        self.written += len(pending)
+
+
+class OutputSet:
+    """The outputs of one source, committed together or not at all.
+
+    Files `open()`ed are temp files, on leaving the with block they are
+    closed and staged with the `OutputCommitter`, unless the block raised or
+    `discard()` was called, then they are deleted.
+    """
+
+    def __init__(self, committer):
+        self._committer = committer
+        self._files = []  # (file, temp path, path)
+        self._discarded = False
+
+    def open(self, path, mode='w'):
+        """Open a temp file to be committed as `path`, `mode` is a write mode of `open()`."""
+        temp_path = self._committer.temp_path(path)
+        out_f = open(temp_path, mode.replace('w', 'x'))
+        self._files.append((out_f, temp_path, path))
+        return out_f
+
+    def discard(self):
+        """Don't commit these outputs, the existing files are left as they are."""
+        self._discarded = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        keep = exc_type is None and not self._discarded
+        try:
+            changed = self._changed() if keep else {}
+        except BaseException:
+            keep = False
+            raise
+        finally:
+            for out_f, temp_path, _ in self._files:
+                out_f.close()
+                if not keep:
+                    os.unlink(temp_path)
+        if keep:
+            self._committer.stage([(temp_path, path) for _, temp_path, path in self._files if changed[temp_path]],
+                                  [temp_path for temp_path, is_changed in changed.items() if not is_changed])
+
+    def _changed(self):
+        """{temp path: are its bytes new?}, the new ones are fsynced if the committer syncs."""
+        changed = {}
+        for out_f, temp_path, path in self._files:
+            out_f.flush()
+            changed[temp_path] = not same_bytes(temp_path, os.fstat(out_f.fileno()).st_size, path)
+            if changed[temp_path] and self._committer.sync:
+                os.fsync(out_f.fileno())
+        return changed
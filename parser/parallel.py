@@ -0,0 +1,155 @@
+import contextlib
+import io
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from parser.jack_tokenizer import JackTokenizer
+from parser.compilation_engine import CompilationEngine
+from parser.emitters import RecordingEmitter, replay
+from parser.utils.exceptions import CompileError
+
+# The only things the pre-scan cares about: comments and strings (so braces
+# and keywords inside them are skipped), braces and subroutine keywords.
+PRE_SCAN = re.compile(r'//[^\n]*|/\*.*?\*/|"[^"\n]*"|[{}]|\b(?:constructor|function|method)\b', re.S)
+
+# Text between two subroutines may only be whitespace and comments.
+BLANK = re.compile(r'(?:\s+|//[^\n]*|/\*.*?\*/)*', re.S)
+
+SUBROUTINES_PER_JOB = 4  # batches handed to each worker, for load balancing.
+
+
+def find_subroutines(source):
+    """Find the (start, end) offsets of every `subroutineDec` in a class.
+
+    A subroutine starts at a subroutine keyword directly inside the class
+    body and ends just after the '}' that closes its body.
+
+    :returns: a list of (start, end), or None if the class does not look
+        like 'class' className '{' classVarDec* subroutineDec* '}'.
+    """
+
+    subroutines = []
+    depth = 0
+    start = None
+    class_end = None  # offset of the '}' closing the class.
+    for match in PRE_SCAN.finditer(source):
+        lexeme = match.group(0)
+        if lexeme == '{':
+            depth += 1
+        elif lexeme == '}':
+            depth -= 1
+            if depth == 1 and start is not None:
+                subroutines.append((start, match.end()))
+                start = None
+            elif depth == 0:
+                class_end = match.start()
+                break
+        elif depth == 1 and start is None and lexeme[0] not in '/"':
+            start = match.start()
+
+    if depth != 0 or start is not None or class_end is None:
+        return None
+
+    # Nothing but comments may follow a subroutine except another subroutine or the closing '}'.
+    ends = [next_start for next_start, _ in subroutines[1:]] + [class_end]
+    for (_, end), next_start in zip(subroutines, ends):
+        if BLANK.fullmatch(source, end, next_start) is None:
+            return None
+    return subroutines
+
+
+def compile_subroutines(sources, chunk_size=None):
+    """Compile each subroutine source on its own, in a worker process.
+
+    :returns: the recorded emitter events of each subroutine.
+    """
+
+    results = []
+    for source in sources:
+        jt = JackTokenizer(io.StringIO(source), chunk_size)
+        recorder = RecordingEmitter()
+        CompilationEngine(jt, recorder).compile_subroutine()
+        if jt.has_more_tokens():
+            raise CompileError("Unexpected tokens after subroutine declaration")
+        results.append(recorder.events)
+    return results
+
+
+def compile_class_parallel(engine, source, jobs=None, chunk_size=None, executor=None):
+    """Compiles a complete class, parsing its subroutines in a process pool.
+
+    `source` must be the text `engine` is tokenizing.
+    The class without its subroutines is parsed here while the subroutines
+    are parsed by the pool, then the results are stitched back together in
+    source order, so the output is identical to `engine.compile_class()`.
+    If the pre-scan or any part of the parallel parse fails, the class is
+    compiled again with `engine.compile_class()` so errors are reported exactly
+    as they would be without the pool.
+    Semantic checks need the whole class, so with `engine.checks` turned on
+    the class is always compiled with `engine.compile_class()`.
+    Starting the processes costs more than parsing a class, so to compile
+    many classes pass the same `executor`, a `ProcessPoolExecutor` of
+    `jobs` processes, to every call. Without one a pool is made for this class.
+    """
+
+    jobs = jobs or os.cpu_count()
+    if jobs < 2 or engine.checks:
+        return engine.compile_class()
+
+    subroutines = find_subroutines(source)
+    if not subroutines or len(subroutines) < 2:
+        return engine.compile_class()
+
+    try:
+        # the class with every subroutine cut out.
+        skeleton = source[:subroutines[0][0]] + source[subroutines[-1][1]:]
+        recorder = RecordingEmitter()
+        CompilationEngine(JackTokenizer(io.StringIO(skeleton), chunk_size), recorder).compile_class()
+        head, tail = recorder.events[:-2], recorder.events[-2:]  # tail is the closing '}' and </class>
+
+        sources = [source[start:end] for start, end in subroutines]
+        batch_size = -(-len(sources) // (jobs * SUBROUTINES_PER_JOB))
+        batches = [sources[i:i + batch_size] for i in range(0, len(sources), batch_size)]
+        with ProcessPoolExecutor(jobs) if executor is None else contextlib.nullcontext(executor) as executor:
+            results = list(executor.map(compile_subroutines, batches, [chunk_size] * len(batches)))
+    except CompileError:
+        return engine.compile_class()
+
+    emitter = engine._emitter
+    replay(head, emitter)
+    for batch in results:
+        for events in batch:
+            replay(events, emitter)
+    replay(tail, emitter)
+
+
+if __name__ == "__main__":
+    import sys
+
+    def compile_class(source, jobs):
+        recorder = RecordingEmitter()
+        engine = CompilationEngine(JackTokenizer(io.StringIO(source)), recorder)
+        try:
+            if jobs == 1:
+                engine.compile_class()
+            else:
+                compile_class_parallel(engine, source, jobs)
+        except CompileError as ex:
+            return recorder.events, str(ex)
+        return recorder.events, None
+
+    subroutines = 'function void f() { return; } method int g(int a) { var int b; let b = a; return b; } '
+    sources = [
+        'class A { field int x; ' + subroutines + '}',
+        'class A { field int x; ' + subroutines + '// done\n /* end */ }',
+        # anything after the subroutines but the closing '}' is an error, not a classVarDec.
+        'class A { ' + subroutines + 'field int y; }',
+        'class A { field int x; ' + subroutines + 'static int z; }',
+        'class A { ' + subroutines + 'let y = 1; }',
+        'class A { ' + subroutines + 'function void h() { return; } field int y; }',
+    ]
+    assert find_subroutines(sources[2]) is None
+    for source in sources:
+        assert compile_class(source, 2) == compile_class(source, 1), source
+    print("ok", file=sys.stderr)
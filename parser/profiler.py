@@ -0,0 +1,116 @@
+import json
+import time
+
+# compile_* method: the grammar rule (xml element) it compiles.
+RULE_NAMES = {
+    'compile_class': 'class',
+    'compile_class_var_dec': 'classVarDec',
+    'compile_subroutine': 'subroutineDec',
+    'compile_parameter_list': 'parameterList',
+    'compile_var_dec': 'varDec',
+    'compile_subroutine_body': 'subroutineBody',
+    'compile_statements': 'statements',
+    'compile_do': 'doStatement',
+    'compile_let': 'letStatement',
+    'compile_while': 'whileStatement',
+    'compile_return': 'returnStatement',
+    'compile_if': 'ifStatement',
+    'compile_expression': 'expression',
+    'compile_term': 'term',
+    'compile_expression_list': 'expressionList',
+}
+
+TOKENIZER_OPERATIONS = ['advance', 'token_type', 'key_word', 'symbol', 'identifier', 'int_val', 'string_val']
+
+
+class RuleProfiler:
+    """Times every grammar rule and tokenizer operation by its nesting path.
+
+    eg: class/subroutineDec/subroutineBody/statements/ifStatement/expression/term
+
+    Nothing is timed until a tokenizer or engine is given to `attach()`,
+    which wraps its methods on that instance only. One profiler may be
+    attached to many engines, their times add up.
+    """
+
+    def __init__(self, timer=time.perf_counter):
+        self.timer = timer
+        self.stats = {}  # path tuple: [calls, inclusive seconds, exclusive seconds]
+        self._stack = []  # [path, start time, time spent in children] of every open rule.
+
+    def attach(self, *objects):
+        """Profile the compile_* methods and tokenizer operations of each object."""
+        for obj in objects:
+            for method_name, rule in RULE_NAMES.items():
+                if hasattr(obj, method_name):
+                    setattr(obj, method_name, self.wrap(getattr(obj, method_name), rule))
+            if hasattr(obj, 'advance'):
+                for method_name in TOKENIZER_OPERATIONS:
+                    setattr(obj, method_name, self.wrap(getattr(obj, method_name), method_name))
+
+    def wrap(self, method, rule):
+        def profiled(*args, **kwargs):
+            stack = self._stack
+            path = (stack[-1][0] if stack else ()) + (rule,)
+            frame = [path, self.timer(), 0.0]
+            stack.append(frame)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                inclusive = self.timer() - frame[1]
+                stack.pop()
+                if stack:
+                    stack[-1][2] += inclusive
+                stat = self.stats.get(path)
+                if stat is None:
+                    stat = self.stats[path] = [0, 0.0, 0.0]
+                stat[0] += 1
+                stat[1] += inclusive
+                stat[2] += inclusive - frame[2]
+
+        profiled.__wrapped__ = method
+        return profiled
+
+    def report(self, limit=None):
+        """A table of the slowest paths by exclusive time."""
+        lines = ["{:>10} {:>12} {:>12}  {}".format('calls', 'inclusive', 'exclusive', 'path')]
+        rows = sorted(self.stats.items(), key=lambda item: item[1][2], reverse=True)
+        for path, (calls, inclusive, exclusive) in rows[:limit]:
+            lines.append("{:>10} {:>12.6f} {:>12.6f}  {}".format(calls, inclusive, exclusive, '/'.join(path)))
+        return '\n'.join(lines)
+
+    def write_collapsed(self, outfile):
+        """Write collapsed stacks, as read by flamegraph.pl, weighted by exclusive microseconds."""
+        for path, (_, _, exclusive) in sorted(self.stats.items()):
+            print("{} {}".format(';'.join(path), round(exclusive * 1e6)), file=outfile)
+
+    def speedscope(self, name="jack compile"):
+        """A speedscope json document with one weighted sample per path."""
+        frames = []
+        frame_indexes = {}
+        samples = []
+        weights = []
+        for path, (_, _, exclusive) in sorted(self.stats.items()):
+            for rule in path:
+                if rule not in frame_indexes:
+                    frame_indexes[rule] = len(frames)
+                    frames.append({'name': rule})
+            samples.append([frame_indexes[rule] for rule in path])
+            weights.append(round(exclusive * 1e6))
+
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'microseconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights,
+            }],
+        }
+
+    def write_speedscope(self, outfile, name="jack compile"):
+        json.dump(self.speedscope(name), outfile)
@@ -0,0 +1,183 @@
+import asyncio
+import collections
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+MAX_PIPELINE = 32  # requests a connection may have in flight before we stop reading from it.
+MAX_QUEUE = 1024  # requests waiting for a worker before new ones are turned away.
+MAX_REQUEST_BYTES = 16 << 20  # longest request line.
+LATENCY_SAMPLES = 1000  # latencies kept for the stats percentiles.
+
+WARM_UP_SOURCE = 'class Warm { function void f() { do f(); return; } }'
+
+
+class CompileService:
+    """Compiles Jack sources sent over a socket on a pool of warm processes.
+
+    The protocol is json lines. A request is
+    {"id": 1, "source": "class Main {...}", "options": {...}} and its response
+    {"id": 1, "outputs": {format: output}, "diagnostics": [[line, message], ...]},
+    or {"id": 1, "error": message} if it could not be compiled at all.
+    {"id": 2, "op": "stats"} answers with {"id": 2, "stats": {...}} at once.
+
+    Requests are pipelined: a client may send many without waiting, and
+    responses come back as they finish, matched by id. At most
+    `concurrency` requests run at once; the rest wait, up to `max_queue`
+    of them, and further ones get a 'busy' error. A connection with
+    `max_pipeline` requests in flight is not read from until one finishes,
+    so a client that floods us is slowed down by its own socket.
+    """
+
+    def __init__(self, compile_source, workers=None, concurrency=None, max_pipeline=MAX_PIPELINE,
+                 max_queue=MAX_QUEUE):
+        """`compile_source(source, options)` returns the (outputs, diagnostics)
+        of a request, it is run in the pool so it must be picklable.
+        """
+        self.compile_source = compile_source
+        self.workers = workers or os.cpu_count()
+        self.concurrency = concurrency or self.workers
+        self.max_pipeline = max_pipeline
+        self.max_queue = max_queue
+        self.pool = None
+        self.server = None
+        self._slots = None
+        self._started = time.monotonic()
+        self._latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.counters = collections.Counter()  # requests, completed, errors, busy, connections...
+        self.running = 0
+        self.waiting = 0
+
+    async def start(self, address):
+        """Warm up the pool and listen on a (host, port) or a Unix socket path."""
+        self._slots = asyncio.Semaphore(self.concurrency)
+        await self._start_pool()
+
+        if isinstance(address, tuple):
+            self.server = await asyncio.start_server(self._serve, *address, limit=MAX_REQUEST_BYTES)
+        else:
+            self.server = await asyncio.start_unix_server(self._serve, address, limit=MAX_REQUEST_BYTES)
+        return self.server
+
+    async def serve_forever(self, address):
+        await self.start(address)
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+
+        def percentile(fraction):
+            return round(latencies[int(fraction * (len(latencies) - 1))] * 1000, 3) if latencies else None
+
+        return dict(self.counters, **{
+            'uptime': round(time.monotonic() - self._started, 3),
+            'workers': self.workers,
+            'running': self.running,
+            'waiting': self.waiting,
+            'latency_ms_p50': percentile(0.5),
+            'latency_ms_p99': percentile(0.99),
+        })
+
+    async def _serve(self, reader, writer):
+        self.counters['connections'] += 1
+        in_flight = asyncio.Semaphore(self.max_pipeline)
+        write_lock = asyncio.Lock()
+        tasks = set()
+
+        async def respond(response):
+            async with write_lock:
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+
+        async def handle(request):
+            try:
+                await respond(await self._handle(request))
+            except (ConnectionError, asyncio.CancelledError):
+                pass
+            finally:
+                in_flight.release()
+
+        try:
+            while True:
+                await in_flight.acquire()  # backpressure: stop reading while the pipeline is full.
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):
+                    break  # request too long or connection lost.
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("a request must be a json object")
+                except ValueError as ex:
+                    in_flight.release()
+                    await respond({'id': None, 'error': "Bad request: {}".format(ex)})
+                    continue
+                task = asyncio.ensure_future(handle(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        finally:
+            writer.close()
+
+    async def _handle(self, request):
+        request_id = request.get('id')
+        if request.get('op') == 'stats':
+            return {'id': request_id, 'stats': self.stats()}
+        if request.get('op', 'compile') != 'compile' or not isinstance(request.get('source'), str):
+            return {'id': request_id, 'error': "Expected a compile request with a source"}
+
+        self.counters['requests'] += 1
+        if self.waiting >= self.max_queue:
+            self.counters['busy'] += 1
+            return {'id': request_id, 'error': "busy"}
+
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            outputs, diagnostics = await loop.run_in_executor(
+                self.pool, self.compile_source, request['source'], request.get('options') or {})
+        except BrokenProcessPool:
+            self.counters['errors'] += 1
+            await self._restart_pool()
+            return {'id': request_id, 'error': "A worker died compiling this request"}
+        except Exception as ex:  # bad options, raised in the worker.
+            self.counters['errors'] += 1
+            return {'id': request_id, 'error': "{}: {}".format(type(ex).__name__, ex)}
+        finally:
+            self.running -= 1
+            self._slots.release()
+
+        self.counters['completed'] += 1
+        self._latencies.append(time.monotonic() - started)
+        return {'id': request_id, 'outputs': outputs, 'diagnostics': diagnostics}
+
+    async def _start_pool(self):
+        loop = asyncio.get_running_loop()
+        self.pool = ProcessPoolExecutor(self.workers)
+        # one compile per worker starts every process and fills its caches.
+        await asyncio.gather(*(loop.run_in_executor(self.pool, self.compile_source, WARM_UP_SOURCE, {})
+                               for _ in range(self.workers)))
+
+    async def _restart_pool(self):
+        if self.pool is not None and getattr(self.pool, '_broken', False):
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            try:
+                await self._start_pool()
+            except BrokenProcessPool:
+                pass  # restarted again by the next request it fails.
@@ -0,0 +1,212 @@
+"""Live metrics of a long compile, for dashboards and alerts.
+
+A `CompileMetrics` is told when each file starts and ends compiling. A
+`MetricsReporter` thread reads it every `interval` seconds and writes a
+snapshot in the Prometheus text exposition format, eg: for node_exporter's
+textfile collector, and/or a progress line to a terminal.
+
+    metrics = CompileMetrics(total_files)
+    with MetricsReporter(metrics, 'jack.prom', progress_f=sys.stderr):
+        for file in files:
+            jt = JackTokenizer(file)
+            metrics.start(name, jt)
+            ...
+            metrics.finish(diagnostics, compiled, size)
+
+Nothing is counted per token: the tokens of the files being compiled are
+read from the `line_number` of their tokenizers when a snapshot is taken,
+so compiles pay nothing between `start()` and `finish()`.
+"""
+import os
+import threading
+import time
+
+from parser.limits import memory_usage
+
+METRICS_INTERVAL = 10.0  # seconds between snapshots.
+PREFIX = 'jack_compile_'
+
+
+def escape_label(value):
+    """`value` escaped for a label value of the text exposition format."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class CompileMetrics:
+    """Counters of the files compiled so far, and the tokenizers of the ones being compiled.
+
+    `start()` and `finish()` are called by the thread compiling a file, from
+    any number of threads. Only `finish()` takes a lock, once per file,
+    snapshots read the counters as they are without one.
+    """
+
+    def __init__(self, total_files=None):
+        self.total_files = total_files  # None if unknown, eg: for a tar read as a stream.
+        self.files = 0
+        self.failed_files = 0  # stopped by a syntax error.
+        self.semantic_errors = 0
+        self.tokens = 0
+        self.bytes = 0
+        self.slowest_file = None
+        self.slowest_seconds = 0.0
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self._active = {}  # thread id: (name, tokenizer, start time) of the file it is compiling.
+        self._lock = threading.Lock()
+
+    def start(self, name, tokenizer):
+        """The current thread starts compiling `name`, read by `tokenizer`."""
+        self._active[threading.get_ident()] = (name, tokenizer, time.perf_counter())
+
+    def finish(self, diagnostics, compiled, size):
+        """The current thread is done with its file, of `size` bytes, with these `diagnostics`."""
+        name, tokenizer, started = self._active.pop(threading.get_ident())
+        seconds = time.perf_counter() - started
+        with self._lock:
+            self.files += 1
+            self.failed_files += not compiled
+            self.semantic_errors += len(diagnostics) - (not compiled)
+            self.tokens += tokenizer.line_number - 1
+            self.bytes += size
+            if seconds > self.slowest_seconds:
+                self.slowest_file, self.slowest_seconds = name, seconds
+
+    def snapshot(self):
+        """The counters now, with the files in progress counted in `tokens`, `elapsed` and `current_seconds`.
+
+        `current_seconds` is how long the oldest file in progress has been
+        compiling, a file slower than all the finished ones is the slowest.
+        """
+        now = time.perf_counter()
+        tokens = self.tokens
+        current_seconds = 0.0
+        slowest_file, slowest_seconds = self.slowest_file, self.slowest_seconds
+        for name, tokenizer, started in list(self._active.values()):
+            tokens += max(tokenizer.line_number - 1, 0)
+            current_seconds = max(current_seconds, now - started)
+            if now - started > slowest_seconds:
+                slowest_file, slowest_seconds = name, now - started
+        return {
+            'elapsed': now - self._started,
+            'files': self.files,
+            'remaining': None if self.total_files is None else self.total_files - self.files,
+            'failed_files': self.failed_files,
+            'semantic_errors': self.semantic_errors,
+            'tokens': tokens,
+            'bytes': self.bytes,
+            'slowest_file': slowest_file,
+            'slowest_seconds': slowest_seconds,
+            'current_seconds': current_seconds,
+            'resident_memory': memory_usage(),
+        }
+
+
+class MetricsReporter:
+    """Reports a `CompileMetrics` every `interval` seconds on a daemon thread.
+
+    Snapshots are written to `path`, replaced atomically so a scraper never
+    reads half of one, and/or as a progress line rewritten in place on
+    `progress_f`. Rates are over the last interval, and
+    `last_progress_timestamp_seconds` is when tokens were last read, so an
+    alert can fire on a stall or on throughput below expectations.
+    A final snapshot is reported by `stop()`, or on leaving a with block.
+    """
+
+    def __init__(self, metrics, path=None, interval=METRICS_INTERVAL, progress_f=None):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.progress_f = progress_f
+        self._previous = None  # the last snapshot.
+        self._last_progress = time.time()
+        self._progress_width = 0  # of the progress line shown, to blank it out.
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='jack-metrics', daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self.report()
+        if self.progress_f is not None:
+            print(file=self.progress_f, flush=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.report()
+
+    def report(self):
+        """Take a snapshot and report it."""
+        snapshot = self.metrics.snapshot()
+        previous = self._previous or {'elapsed': 0.0, 'tokens': 0, 'bytes': 0}
+        seconds = snapshot['elapsed'] - previous['elapsed']
+        snapshot['tokens_per_second'] = (snapshot['tokens'] - previous['tokens']) / seconds if seconds > 0 else 0.0
+        snapshot['bytes_per_second'] = (snapshot['bytes'] - previous['bytes']) / seconds if seconds > 0 else 0.0
+        if snapshot['tokens'] > previous['tokens']:
+            self._last_progress = time.time()
+        self._previous = snapshot
+        if self.path is not None:
+            temp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+            with open(temp_path, 'w') as metrics_f:
+                metrics_f.write(self.exposition(snapshot))
+            os.replace(temp_path, self.path)
+        if self.progress_f is not None:
+            line = self.progress_line(snapshot)
+            print('\r' + line.ljust(self._progress_width), end='', file=self.progress_f, flush=True)
+            self._progress_width = len(line)
+
+    def exposition(self, snapshot):
+        """`snapshot` in the Prometheus text exposition format."""
+        lines = []
+
+        def metric(name, metric_type, help_text, *samples):
+            lines.append('# HELP {}{} {}'.format(PREFIX, name, help_text))
+            lines.append('# TYPE {}{} {}'.format(PREFIX, name, metric_type))
+            for labels, value in samples:
+                lines.append('{}{}{} {}'.format(PREFIX, name, labels, value))
+
+        metric('files_total', 'counter', "Files compiled.", ('', snapshot['files']))
+        if snapshot['remaining'] is not None:
+            metric('files_remaining', 'gauge', "Files left to compile.", ('', snapshot['remaining']))
+        metric('tokens_total', 'counter', "Tokens read, with those of the files in progress.",
+               ('', snapshot['tokens']))
+        metric('bytes_total', 'counter', "Source bytes of the files compiled.", ('', snapshot['bytes']))
+        metric('tokens_per_second', 'gauge', "Tokens read per second over the last interval.",
+               ('', round(snapshot['tokens_per_second'], 3)))
+        metric('bytes_per_second', 'gauge', "Source bytes compiled per second over the last interval.",
+               ('', round(snapshot['bytes_per_second'], 3)))
+        metric('errors_total', 'counter', "Files stopped by a syntax error, and semantic errors.",
+               ('{kind="syntax"}', snapshot['failed_files']), ('{kind="semantic"}', snapshot['semantic_errors']))
+        if snapshot['slowest_file'] is not None:
+            metric('slowest_file_seconds', 'gauge', "Seconds taken by the slowest file so far.",
+                   ('{{file="{}"}}'.format(escape_label(snapshot['slowest_file'])),
+                    round(snapshot['slowest_seconds'], 6)))
+        metric('current_file_seconds', 'gauge', "Seconds the oldest file in progress has been compiling.",
+               ('', round(snapshot['current_seconds'], 6)))
+        metric('resident_memory_bytes', 'gauge', "Resident memory of the compiling process.",
+               ('', snapshot['resident_memory']))
+        metric('start_time_seconds', 'gauge', "Unix time the compile started.", ('', self.metrics.start_time))
+        metric('last_progress_timestamp_seconds', 'gauge', "Unix time tokens were last read.",
+               ('', round(self._last_progress, 3)))
+        return '\n'.join(lines) + '\n'
+
+    def progress_line(self, snapshot):
+        """`snapshot` as one line for a terminal."""
+        files = snapshot['files'] if snapshot['remaining'] is None else '{}/{}'.format(
+            snapshot['files'], snapshot['files'] + snapshot['remaining'])
+        line = "{} files, {:.0f} tokens/s, {:.1f} KiB/s, {} errors, {:.0f} MiB".format(
+            files, snapshot['tokens_per_second'], snapshot['bytes_per_second'] / 1024,
+            snapshot['failed_files'] + snapshot['semantic_errors'], snapshot['resident_memory'] / 2 ** 20)
+        if snapshot['slowest_file'] is not None:
+            line += ", slowest {} ({:.2f}s)".format(os.path.basename(snapshot['slowest_file']),
+                                                    snapshot['slowest_seconds'])
+        return line
@@ -0,0 +1,57 @@
+"""Compile many files on a pool of threads.
+
+Tokenizers and engines share no mutable state, so each thread can compile
+its own files. On free-threaded CPython (3.13t and later, running with the
+GIL off) the threads compile in parallel without the process pool's costs
+of starting workers and pickling results. With the GIL they could only take
+turns, and pay for switching between them, so the files are compiled on
+the calling thread instead.
+"""
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+
+def gil_enabled():
+    """Is the GIL on? Always on before Python 3.13."""
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return True if is_gil_enabled is None else is_gil_enabled()
+
+
+def usable_threads(threads):
+    """How many of `threads` can compile in parallel in this interpreter."""
+    return 1 if gil_enabled() else max(threads, 1)
+
+
+def compile_files(files, compile_file, threads):
+    """Call `compile_file(file)` for every one of `files` on `threads` threads.
+
+    `compile_file` returns the errors of its file in its result, anything it
+    raises stops the iteration.
+
+    :returns: an iterator of (file, result), in the order of `files`.
+    """
+
+    threads = usable_threads(threads)
+    if threads == 1:
+        return ((file, compile_file(file)) for file in files)
+    return _compile_on_pool(list(files), compile_file, threads)
+
+
+def _compile_on_pool(files, compile_file, threads):
+    with ThreadPoolExecutor(threads, thread_name_prefix='jack-compile') as executor:
+        yield from zip(files, executor.map(compile_file, files))
+
+
+if __name__ == "__main__":
+    from parser.api import check_source
+    from parser.utils.exceptions import CompileEndOfInputError
+
+    # a truncated file is a result like any other, on the calling thread and on the pool.
+    sources = ['class A { function void f() { return; } }', 'class A { function void f() { return; }', 'class B {']
+    for results in (compile_files(sources, check_source, 1), _compile_on_pool(sources, check_source, 2)):
+        results = [result for _, result in results]
+        assert results[0].ok, results[0].diagnostics
+        for result in results[1:]:
+            assert isinstance(result.error, CompileEndOfInputError), result.error
+
+    print("ok", file=sys.stderr)
@@ -1,70 +1,160 @@
 class CompileError(Exception):
-    pass
+    """A syntax error, or a resource limit that stopped a compile.
+
+    The engine raises and throws away errors all the time while it tries
+    alternatives, so nothing is formatted until the message is shown:
+    `message` is a format string for `args`, used as is without them.
+    A rule that fails because one of its parts did raises its own error
+    `from` the part's, and reads "its message: the part's message".
+
+    `code` identifies the kind of error and `rule` the grammar rule whose
+    error it is, None for errors of single tokens. `expected` are the
+    tokens (lexemes, or 'identifier', 'integerConstant' and
+    'stringConstant') that would have been accepted, or `first` names the
+    grammar rule whose FIRST set they are. See `parser.diagnostics`.
+    """
+
+    code = 'E100'
+    rule = None
+
+    def __init__(self, message='', *args, expected=None, first=None):
+        super().__init__(message, *args)
+        self.expected = expected
+        self.first = first
+
+    @property
+    def message(self):
+        """The message of this error alone, without its causes."""
+        message, *args = self.args
+        return message.format(*args) if args else message
+
+    def __str__(self):
+        # a loop, not recursion: the iterative engine nests deeper than the stack.
+        messages = []
+        error = self
+        while isinstance(error, CompileError):
+            messages.append(error.message)
+            error = error.__cause__
+        return ': '.join(messages)
+
+
+class OneOf:
+    """Formats a sequence as 'a'| 'b'| 'c', when the message is shown."""
+
+    __slots__ = ('items',)
+
+    def __init__(self, items):
+        self.items = items
+
+    def __str__(self):
+        return "| ".join("'{}'".format(item) for item in self.items)
 
 
 class CompileKeywordError(CompileError):
-    pass
+    code = 'E101'
 
 
 class CompileSymbolError(CompileError):
-    pass
+    code = 'E102'
 
 
 class CompileTypeError(CompileError):
-    pass
+    code = 'E103'
+
+
+class CompileEndOfInputError(CompileError):
+    code = 'E104'
 
 
 class CompileClassVarDecError(CompileError):
-    pass
+    code = 'E110'
+    rule = 'classVarDec'
 
 
 class CompileSubroutineError(CompileError):
-    pass
+    code = 'E111'
+    rule = 'subroutineDec'
 
 
 class CompileParameterListError(CompileError):
-    pass
+    code = 'E112'
+    rule = 'parameterList'
 
 
 class CompileSubroutineBodyError(CompileError):
-    pass
+    code = 'E113'
+    rule = 'subroutineBody'
 
 
 class CompileVarDecError(CompileError):
-    pass
+    code = 'E114'
+    rule = 'varDec'
 
 
 class CompileLetError(CompileError):
-    pass
+    code = 'E120'
+    rule = 'letStatement'
 
 
 class CompileExpressionError(CompileError):
-    pass
+    code = 'E130'
+    rule = 'expression'
 
 
 class CompileOpError(CompileError):
-    pass
+    code = 'E131'
+    rule = 'op'
 
 
 class CompileKeywordConstantError(CompileError):
-    pass
+    code = 'E132'
+    rule = 'keywordConstant'
 
 
 class CompileDoError(CompileError):
-    pass
+    code = 'E123'
+    rule = 'doStatement'
 
 
 class CompileSubroutineCallError(CompileError):
-    pass
+    code = 'E133'
+    rule = 'subroutineCall'
 
 
 class CompileReturnError(CompileError):
-    pass
+    code = 'E124'
+    rule = 'returnStatement'
 
 
 class CompileIfError(CompileError):
-    pass
+    code = 'E121'
+    rule = 'ifStatement'
 
 
 class CompileWhileError(CompileError):
-    pass
+    code = 'E122'
+    rule = 'whileStatement'
+
+
+class CompileLimitError(CompileError):
+    code = 'E200'
+
+
+class CompileSourceSizeError(CompileLimitError):
+    code = 'E201'
+
+
+class CompileTokenLimitError(CompileLimitError):
+    code = 'E202'
+
+
+class CompileNestingError(CompileLimitError):
+    code = 'E203'
+
+
+class CompileTimeLimitError(CompileLimitError):
+    code = 'E204'
+
+
+class CompileMemoryLimitError(CompileLimitError):
+    code = 'E205'
@@ -18,3 +18,16 @@ class PlusEqualsableIterator:
 
     def __repr__(self):
         return "<{} at {}>".format(self.__class__.__name__, hex(id(self)))
+
+
+class DiscardingIterator(PlusEqualsableIterator):
+    """A `PlusEqualsableIterator` that keeps nothing, it is always empty."""
+
+    def __init__(self):
+        pass
+
+    def __next__(self):
+        raise StopIteration
+
+    def __iadd__(self, other):
+        return self
@@ -3,6 +3,7 @@ import re
 LINE_COMMENT = re.compile("//.*\n")  # // anything till end of string.
 BLOCK_COMMENT_START = re.compile("/\*")  # /* anywhere in a string.
 BLOCK_COMMENT = re.compile("/\*.*\*/", re.S)  # /* until */ matches over newlines.
+WHITESPACE = re.compile("\s+")
 
 # any of these keywords
 KEYWORD = re.compile(
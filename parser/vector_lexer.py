@@ -0,0 +1,207 @@
+"""A numpy lexer backend for `JackTokenizer`.
+
+Every byte of the source is classified at once with a lookup table, comments
+and strings are turned into spans by binary searches and pointer jumping over
+their delimiters and prefix sums, and token boundaries are found with
+vectorized diffs and masks. No Python loop runs per byte or per delimiter.
+The tokens are those `JackTokenizer` finds in streaming mode, as three arrays
+of kinds (`token_types`) and start and end offsets.
+
+numpy is optional, `numpy` is None when it isn't installed.
+"""
+import threading
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - numpy is optional
+    numpy = None
+
+from .utils import token_types
+from .utils import patterns
+
+# byte classes
+BLANK, LETTER, DIGIT, SYMBOL, QUOTE, SLASH, OTHER = range(7)
+
+KEYWORDS = [keyword.encode() for keyword in patterns.KEYWORD.pattern.split('|')]
+
+# Bytes that start an identifier (patterns.IDENTIFIER is '[A-z_]') without being
+# word characters. Sources using them outside strings and comments are not handled.
+ODD_IDENTIFIER_STARTS = b'\\^`'
+
+_byte_classes = None
+_byte_classes_lock = threading.Lock()
+
+
+def byte_classes():
+    """The byte class lookup table, built on first use by one thread."""
+    global _byte_classes
+    if _byte_classes is not None:
+        return _byte_classes
+    with _byte_classes_lock:
+        if _byte_classes is not None:
+            return _byte_classes
+        table = numpy.full(256, OTHER, numpy.uint8)
+        table[list(b' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f')] = BLANK
+        table[list(b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz_')] = LETTER
+        table[list(b'0123456789')] = DIGIT
+        table[list(b'{}()[].,;+-*&|<>=~')] = SYMBOL
+        table[ord('"')] = QUOTE
+        table[ord('/')] = SLASH
+        _byte_classes = table
+    return _byte_classes
+
+
+def find_spans(data):
+    """Find the strings and comments of the source, in order.
+
+    Only quotes, comment starts, comment ends and newlines are looked at:
+    a quote inside a comment does not start a string and a comment start
+    inside a string does not start a comment, so the openers are taken in
+    order, each skipping to its own end and the openers before it.
+
+    Every opener's end, and so the next opener taken after it, is found
+    at once by binary searches. The openers taken are the chain of next
+    openers from the first one, found by pointer jumping: the chain of
+    length 2 ** (k + 1) is the chain of length 2 ** k followed by the nodes
+    2 ** k steps after each of its nodes, so it takes log(openers) array steps.
+
+    :returns: (string starts, string ends, comment starts, comment ends) arrays
+    """
+
+    size = len(data)
+    is_slash = data == ord('/')
+    is_quote = data == ord('"')
+    is_line_comment = numpy.zeros(size, bool)
+    is_line_comment[:-1] = is_slash[:-1] & (data[1:] == ord('/'))
+    is_block_comment = numpy.zeros(size, bool)
+    is_block_comment[:-1] = is_slash[:-1] & (data[1:] == ord('*'))
+
+    openers = numpy.flatnonzero(is_quote | is_line_comment | is_block_comment)
+    if not len(openers):
+        empty = numpy.zeros(0, numpy.int64)
+        return empty, empty, empty, empty
+    quote = is_quote[openers]
+    line_comment = is_line_comment[openers] & ~quote
+
+    def next_after(positions, from_positions):
+        """The first of `positions` at or after each of `from_positions`, `size` if there is none."""
+        positions = numpy.append(numpy.flatnonzero(positions), size)
+        return positions[numpy.minimum(numpy.searchsorted(positions, from_positions), len(positions) - 1)]
+
+    # what each opener would be if taken, and where the scan goes on after it.
+    closing_quote = next_after(is_quote, openers + 1)
+    is_string = quote & (closing_quote < next_after(data == ord('\n'), openers + 1))
+    line_comment_end = next_after(data == ord('\n'), openers + 2)
+    block_comment_end = numpy.minimum(next_after((data[:-1] == ord('*')) & is_slash[1:], openers + 2) + 2, size)
+    ends = numpy.where(quote, numpy.where(is_string, closing_quote + 1, openers + 1),
+                       numpy.where(line_comment, line_comment_end, block_comment_end))
+
+    # the next opener taken after each one, len(openers) past the last.
+    jump = numpy.append(numpy.searchsorted(openers, ends), len(openers))
+    taken = numpy.zeros(1, numpy.int64)
+    while taken[-1] != len(openers):
+        taken = numpy.concatenate((taken, jump[taken]))
+        jump = jump[jump]
+    taken = taken[taken < len(openers)]  # in order, the chain only goes forward.
+
+    is_span = ~quote[taken] | is_string[taken]  # a lone quote is skipped like any unknown character.
+    taken = taken[is_span]
+    strings = taken[quote[taken]]
+    comments = taken[~quote[taken]]
+    return openers[strings], ends[strings], openers[comments], ends[comments]
+
+
+def span_mask(size, starts, ends):
+    """A boolean mask of the bytes inside the [start, end) spans, by prefix sum.
+
+    Spans don't overlap, so the sum is 0 or 1 and fits a byte.
+    """
+    delta = (numpy.bincount(starts, minlength=size + 1).astype(numpy.int8)
+             - numpy.bincount(ends, minlength=size + 1).astype(numpy.int8))
+    return numpy.cumsum(delta[:-1], dtype=numpy.int8).view(bool)
+
+
+def tokenize(text):
+    """Find the tokens of a Jack source.
+
+    :returns: (kinds, starts, ends) arrays, or None for sources this
+        backend can't lex exactly (not ascii, or odd identifier starts).
+    """
+
+    if not text.isascii():
+        return None
+    data = numpy.frombuffer(text.encode('ascii'), numpy.uint8)
+    size = len(data)
+    if not size:
+        empty = numpy.zeros(0, numpy.uint32)
+        return empty.astype(numpy.uint8), empty, empty
+
+    string_starts, string_ends, comment_starts, comment_ends = find_spans(data)
+    classes = byte_classes()[data]
+    classes[span_mask(size, comment_starts, comment_ends)] = BLANK
+    classes[span_mask(size, string_starts, string_ends)] = QUOTE
+
+    outside = classes != QUOTE
+    for odd in ODD_IDENTIFIER_STARTS:
+        if numpy.any((data == odd) & outside):
+            return None
+
+    # every symbol and remaining slash (division) is a token of its own.
+    symbol_starts = numpy.flatnonzero((classes == SYMBOL) | (classes == SLASH))
+
+    # words are runs of letters and digits.
+    is_word = (classes == LETTER) | (classes == DIGIT)
+    edges = numpy.diff(is_word.astype(numpy.int8), prepend=0, append=0)
+    word_starts = numpy.flatnonzero(edges == 1)
+    word_ends = numpy.flatnonzero(edges == -1)
+    lengths = word_ends - word_starts
+
+    starts_with_digit = classes[word_starts] == DIGIT
+
+    # ints are at most 4 digits, a longer or lettered word starting with a digit is split.
+    short_int = starts_with_digit & (lengths <= 4)
+    for offset in range(1, 4):
+        index = numpy.minimum(word_starts + offset, size - 1)
+        short_int &= (lengths <= offset) | (classes[index] == DIGIT)
+
+    # A word that is a keyword is a keyword. patterns.ALL_TERMINATORS tries
+    # keywords first, so a word that only starts with one is split ('double' is 'do' 'uble').
+    is_keyword = numpy.zeros(len(word_starts), bool)
+    must_split = starts_with_digit & ~short_int
+    for keyword in KEYWORDS:
+        starts_with_keyword = lengths >= len(keyword)
+        for offset, char in enumerate(keyword):
+            index = numpy.minimum(word_starts + offset, size - 1)
+            starts_with_keyword &= data[index] == char
+        is_keyword |= starts_with_keyword & (lengths == len(keyword))
+        must_split |= starts_with_keyword & (lengths > len(keyword))
+
+    word_kinds = numpy.where(is_keyword, token_types.KEYWORD,
+                             numpy.where(starts_with_digit, token_types.INT_CONST, token_types.IDENTIFIER))
+
+    split_kinds, split_starts, split_ends = [], [], []
+    for start, end in zip(word_starts[must_split].tolist(), word_ends[must_split].tolist()):
+        for match in patterns.ALL_TERMINATORS.finditer(text, start, end):
+            lexeme = match.group(0)
+            if patterns.KEYWORD.fullmatch(lexeme):
+                split_kinds.append(token_types.KEYWORD)
+            elif lexeme[0].isdigit():
+                split_kinds.append(token_types.INT_CONST)
+            else:
+                split_kinds.append(token_types.IDENTIFIER)
+            split_starts.append(match.start())
+            split_ends.append(match.end())
+
+    keep = ~must_split
+    kinds = numpy.concatenate((
+        numpy.full(len(symbol_starts), token_types.SYMBOL),
+        numpy.full(len(string_starts), token_types.STRING_CONST),
+        word_kinds[keep],
+        split_kinds,
+    )).astype(numpy.uint8)
+    starts = numpy.concatenate((symbol_starts, string_starts, word_starts[keep], split_starts)).astype(numpy.int64)
+    ends = numpy.concatenate((symbol_starts + 1, string_ends, word_ends[keep], split_ends)).astype(numpy.int64)
+
+    order = numpy.argsort(starts, kind='stable')
+    offset_type = numpy.uint32 if size < 2 ** 32 else numpy.uint64
+    return kinds[order], starts[order].astype(offset_type), ends[order].astype(offset_type)
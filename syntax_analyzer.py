@@ -1,50 +1,412 @@
-import sys
+import argparse
+import asyncio
+import base64
+import contextlib
+import functools
+import multiprocessing
 import os
 import io
+import statistics
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
 # generate xml code using jack_tokenizer and compilation engine.
 from parser.jack_tokenizer import JackTokenizer
-from parser.compilation_engine import CompilationEngine
-from parser.utils.exceptions import CompileError
+from parser.compilation_engine import SEMANTIC_CHECKS
+from parser.api import OUTPUT_FORMATS, ENGINES, compile_stream
+from parser.parallel import compile_class_parallel
+from parser.threaded import compile_files, gil_enabled
+from parser.distributed import Coordinator, run_worker, parse_address, crash_message, MAX_ATTEMPTS
+from parser.limits import Limits, hard_limits
+from parser.service import CompileService
+from parser.profiler import RuleProfiler
+from parser.telemetry import METRICS_INTERVAL, CompileMetrics, MetricsReporter
+from parser import benchmark
+from parser.emitters import FanOutEmitter, SourceMapEmitter
+from parser.output import OutputCommitter
+from parser.archives import ARCHIVE_SUFFIXES, is_archive, archive_sources, OutputArchive
+from parser.diagnostics import Diagnostic, write_json_lines
+from parser.utils.exceptions import CompileError, CompileMemoryLimitError, CompileSourceSizeError
+
+SOURCE_MAP_EXTENSION = '.test.map'
+OUTLINE_SUFFIX = '.outline'  # replaces '.test' in output extensions.
 
 
-def analyze(path):
+def analyze(path, chunk_size=None, formats=('xml',), jobs=1, checks=(), profiler=None, engine='recursive',
+            source_map=False, outline=False, limits=None, diagnostics_f=None, threads=1, output_archive=None,
+            metrics=None):
+    """Compile a .jack file or every .jack file of a directory or archive, see `get_files()`.
+
+    Errors are printed, and written as json lines to `diagnostics_f` if given.
+    Outputs are written as the members of `output_archive` if given, see
+    `parser.archives`, else next to their sources.
+    With `jobs`, the subroutines of every class are parsed on one pool of
+    processes, see `parser.parallel`. With `threads`, files are compiled
+    on a thread pool, see `parser.threaded`.
+    Outputs are committed atomically in batches, see `parser.output`, and
+    compared with the expected xml once all are in place.
+    Every file compiled is counted in `metrics` if given, see `parser.telemetry`.
+    """
     # import pdb;pdb.set_trace()
-    for in_file, name in get_files(path):
-        in_base_name = os.path.basename(in_file)
-        outfile = name + ".test.xml"
-        jt = JackTokenizer(in_file)
+    if profiler is not None or source_map or outline or limits or threads > 1 or chunk_size:
+        # only this process is profiled, only its tokenizer records offsets or enforces limits, outlines are cheap
+        # and a parallel parse reads the whole source, when chunks keep memory bounded.
+        jobs = 1
+    if profiler is not None or is_archive(path):
+        threads = 1  # the profiler times one call stack, archive members are read one at a time.
+
+    def compile_file(file):
+        in_file, name = file
+        if not isinstance(in_file, str) and output_archive is None:
+            os.makedirs(os.path.dirname(name) or os.curdir, exist_ok=True)  # the folders of archive members.
+        return analyze_file(in_file, name, chunk_size, formats, jobs, checks, profiler, engine, source_map, outline,
+                            limits, record_offsets=diagnostics_f is not None, committer=committer, metrics=metrics,
+                            executor=executor)
+
+    written = []
+    root = path if os.path.isdir(path) else os.path.dirname(path)
+    # one pool for all the files, starting its processes costs more than parsing a class.
+    parallel = jobs != 1 and (jobs or os.cpu_count()) > 1 and engine == 'recursive' and not checks
+    with ProcessPoolExecutor(jobs or os.cpu_count()) if parallel else contextlib.nullcontext() as executor, \
+            OutputArchive(output_archive, root) if output_archive else OutputCommitter() as committer:
+        for (in_file, name), (diagnostics, compiled) in compile_files(get_files(path), compile_file, threads):
+            report(source_name(in_file, name, path), diagnostics, diagnostics_f)
+            if compiled:
+                written.append(name)
+    if 'xml' in formats and not outline and not output_archive and not is_archive(path):
+        for name in written:
+            compare_output(name)
+
+
+def analyze_file(in_file, name, chunk_size=None, formats=('xml',), jobs=1, checks=(), profiler=None,
+                 engine='recursive', source_map=False, outline=False, limits=None, record_offsets=False,
+                 committer=None, metrics=None, executor=None):
+    """Compile one file of `analyze()`, writing its outputs next to it.
+
+    The outputs are staged with `committer`, or committed at once without
+    one. If a syntax error stops the compile they are dropped, and any from
+    an earlier run left in place. With `jobs`, subroutines are parsed on
+    `executor` if given, see `compile_class_parallel()`.
+
+    :returns: its diagnostics, and whether it compiled (so its outputs were written).
+    """
+
+    if jobs == 1:
+        jt = JackTokenizer(in_file, chunk_size, record_offsets=source_map or record_offsets, limits=limits)
+    else:
+        source = read_source(in_file)
+        jt = JackTokenizer(io.StringIO(source), chunk_size)
+    if metrics is not None:
+        metrics.start(in_file if isinstance(in_file, str) else name + '.jack', jt)
+
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(jt)  # closes the source whether or not the compile got to its end.
+        if committer is None:
+            committer = stack.enter_context(OutputCommitter())
+        outputs = stack.enter_context(committer.outputs())
+        emitters = []
+        for output_format in formats:
+            extension, mode, emitter_class = OUTPUT_FORMATS[output_format]
+            if outline:
+                extension = extension.replace('.test', OUTLINE_SUFFIX, 1)
+            emitters.append(emitter_class(outputs.open(name + extension, mode)))
+        if source_map:
+            emitters.append(SourceMapEmitter(outputs.open(name + SOURCE_MAP_EXTENSION, 'wb'), jt))
+        ce = ENGINES[engine](jt, emitters[0] if len(emitters) == 1 else FanOutEmitter(emitters), checks, outline)
+        if profiler is not None:
+            profiler.attach(jt, ce)
+
+        diagnostics = []
+        compiled = True
+        try:
+            if jobs == 1 or engine != 'recursive':
+                ce.compile_class()
+            else:
+                compile_class_parallel(ce, source, jobs, chunk_size, executor)
+        except CompileError as ex:
+            diagnostics.append(Diagnostic.from_error(ex, jt))
+            compiled = False
+            outputs.discard()
+        except Exception as ex:  # a crash fails this file, not the ones after it.
+            diagnostics.append(Diagnostic.from_error(CompileError(crash_message(ex)), jt))
+            compiled = False
+            outputs.discard()
+        diagnostics.extend(Diagnostic.from_semantic_error(*error) for error in ce.semantic_errors)
+    if metrics is not None:
+        metrics.finish(diagnostics, compiled, source_size(in_file))
+    return diagnostics, compiled
+
+
+def check(path, chunk_size=None, checks=(), engine='recursive', limits=None, diagnostics_f=None, threads=1,
+          metrics=None):
+    """Check the syntax of a .jack file or a directory or archive of them, writing no output.
+
+    Each thread `reset()`s one tokenizer and engine for all the files it
+    checks, rather than building them again for every file. Every file
+    checked is counted in `metrics` if given.
 
-        with open(outfile, 'w') as out_f, io.StringIO() as tokenizer_out, io.StringIO() as parser_out:
-            ce = CompilationEngine(jt, out_f)
+    :returns: the number of files with errors.
+    """
+    reused = threading.local()  # .tokenizer and .engine of the thread.
 
+    def check_file(in_file, name):
+        ce = getattr(reused, 'engine', None)
+        if ce is None:
+            jt = reused.tokenizer = JackTokenizer(in_file, chunk_size, record_offsets=diagnostics_f is not None,
+                                                  limits=limits)
+            ce = reused.engine = ENGINES[engine](jt, None, checks)
+        else:
+            ce.reset(in_file)
+            jt = reused.tokenizer
+        if metrics is not None:
+            metrics.start(in_file if isinstance(in_file, str) else name + '.jack', jt)
+        diagnostics = []
+        with ce:
             try:
                 ce.compile_class()
             except CompileError as ex:
-                print("In {} (line {}): {}".format(in_base_name, jt.line_number, ex))
-
-        # Helpful test code
-        compare_name = name + ".xml"
-        with open(outfile) as my_f, open(compare_name) as compare_f:
-            out_base_name = os.path.basename(outfile)
-            compare_base_name = os.path.basename(compare_name)
-            for index, my_line in enumerate(my_f):
-                compare_line = compare_f.readline()
-                if my_line != compare_line:
-                    print("\n" + "*" * 40)
-                    print("Comparing {} == {}".format(out_base_name, compare_base_name))
-                    print("In {} (line {}): Lines are not equal".format(out_base_name, index))
-                    print("Expected line vs. actual was:")
-                    print(repr(compare_line))
-                    print(repr(my_line))
-            if compare_f.readline():
-                print("File is too short!")
-        # exit("Exiting syntax analyser!!!!!!")
+                diagnostics.append(Diagnostic.from_error(ex, jt))
+            except Exception as ex:  # a crash fails this file, not the ones after it.
+                diagnostics.append(Diagnostic.from_error(CompileError(crash_message(ex)), jt))
+        compiled = not diagnostics
+        diagnostics.extend(Diagnostic.from_semantic_error(*error) for error in ce.semantic_errors)
+        if metrics is not None:
+            metrics.finish(diagnostics, compiled, source_size(in_file))
+        return diagnostics
+
+    if is_archive(path):
+        threads = 1  # archive members are read one at a time.
+    failed = 0
+    for (in_file, name), diagnostics in compile_files(get_files(path), lambda file: check_file(*file), threads):
+        report(source_name(in_file, name, path), diagnostics, diagnostics_f)
+        failed += bool(diagnostics)
+    return failed
+
+
+def report(in_base_name, diagnostics, diagnostics_f=None):
+    """Print the diagnostics of a file, and write them as json lines to `diagnostics_f`."""
+    for diagnostic in diagnostics:
+        print("In {} (line {}): {}".format(in_base_name, diagnostic.line, diagnostic.message))
+    if diagnostics_f is not None:
+        write_json_lines(diagnostics, diagnostics_f, in_base_name)
+
+
+def compile_outputs(source, chunk_size=None, formats=('xml',), checks=(), engine='recursive', limits=None,
+                    kill_on_limit=False):
+    """Compile the source of a class in memory, as a distributed worker does.
+
+    With `kill_on_limit` this process is killed if the compile gets far past
+    its time limit, see `hard_limits()`, so only use it in a worker process.
+
+    Anything but a `CompileError` stopping the compile, eg: a `RecursionError`,
+    is a diagnostic without a line number, and there are no outputs.
+
+    :returns: ({file extension: output}, [(line number, message), ...])
+    """
+
+    out_fs = {}
+    emitters = []
+    for output_format in formats:
+        extension, mode, emitter_class = OUTPUT_FORMATS[output_format]
+        out_fs[extension] = io.BytesIO() if 'b' in mode else io.StringIO()
+        emitters.append(emitter_class(out_fs[extension]))
+
+    try:
+        with hard_limits(limits) if limits and kill_on_limit else contextlib.nullcontext():
+            result = compile_stream(source, FanOutEmitter(emitters), engine=engine, checks=checks, limits=limits,
+                                    chunk_size=chunk_size)
+        diagnostics = [tuple(diagnostic) for diagnostic in result.diagnostics]
+    except MemoryError:
+        diagnostics = [(None, str(CompileMemoryLimitError("Compile ran out of memory")))]
+    except Exception as ex:
+        return {}, [(None, crash_message(ex))]
+    return {extension: out_f.getvalue() for extension, out_f in out_fs.items()}, diagnostics
+
+
+def compile_request(source, options, limits=None, kill_on_limit=False):
+    """Compile a request of the compile service, in a pool process.
+
+    `options` are the json options of the request: "formats", "engine" and
+    "checks", named as on the command line. Outputs are keyed by format,
+    binary ones are base64 encoded. There are none if the compile crashed,
+    only its diagnostic, see `compile_outputs()`, whose `kill_on_limit` ends
+    a pool process far past its limits.
+    """
+
+    formats = tuple(options.get('formats', ('xml',)))
+    checks = tuple(options.get('checks', ()))
+    engine = options.get('engine', 'recursive')
+    for name, given, known in [('format', formats, OUTPUT_FORMATS), ('check', checks, SEMANTIC_CHECKS),
+                               ('engine', [engine], ENGINES)]:
+        for value in given:
+            if value not in known:
+                raise ValueError("Unknown {} {!r}".format(name, value))
+
+    outputs, diagnostics = compile_outputs(source, formats=formats, checks=checks, engine=engine, limits=limits,
+                                           kill_on_limit=kill_on_limit)
+    by_format = {}
+    for output_format in formats:
+        output = outputs.get(OUTPUT_FORMATS[output_format][0])
+        if output is None:
+            continue
+        by_format[output_format] = base64.b64encode(output).decode() if isinstance(output, bytes) else output
+    return by_format, diagnostics
+
+
+def analyze_distributed(path, address, authkey, local_workers=0, chunk_size=None, formats=('xml',), checks=(),
+                        engine='recursive', limits=None):
+    """Like `analyze()`, but the files are compiled by workers connecting to `address`.
+
+    `local_workers` worker processes are started on this machine, others may
+    connect with `--connect` from anywhere that can reach `address`.
+    Dead local workers are replaced, a file whose worker dies is retried up
+    to `MAX_ATTEMPTS` times, or not at all with `limits`, so one bad file
+    can't stop the others. If the local workers keep dying, and no other
+    worker is connected, the files left fail.
+
+    :returns: False if files failed for lack of workers.
+    """
+
+    sources = []
+    for in_file, name in get_files(path):
+        if limits and limits.source_bytes is not None and os.path.getsize(in_file) > limits.source_bytes:
+            error = CompileSourceSizeError("Source is larger than {} bytes".format(limits.source_bytes))
+            print("In {} (line 1): {}".format(os.path.basename(in_file), error))
+            continue
+        with open(in_file) as in_f:
+            sources.append((name, in_f.read()))
+
+    def write_outputs(name, outputs, diagnostics):
+        with committer.outputs() as output_set:
+            for extension, output in outputs.items():
+                output_set.open(name + extension, 'wb' if isinstance(output, bytes) else 'w').write(output)
+        for line_number, message in diagnostics:
+            if line_number is None:  # the worker died.
+                print("In {}.jack: {}".format(os.path.basename(name), message))
+            else:
+                print("In {}.jack (line {}): {}".format(os.path.basename(name), line_number, message))
+        if '.test.xml' in outputs:
+            written.append(name)
+
+    written = []
+    committer = OutputCommitter()
+    coordinator = Coordinator(sources, address, authkey, write_outputs, max_attempts=1 if limits else MAX_ATTEMPTS)
+    compile_source = functools.partial(compile_outputs, chunk_size=chunk_size, formats=formats, checks=checks,
+                                       engine=engine, limits=limits, kill_on_limit=True)
+
+    def start_worker():
+        worker = multiprocessing.Process(target=run_worker, args=(coordinator.address, authkey, compile_source))
+        worker.start()
+        return worker
+
+    def replace_dead_workers():
+        """:returns: whether any local worker is left."""
+        nonlocal restarts_left
+        for index, worker in enumerate(workers):
+            if worker.exitcode not in (None, 0) and restarts_left:
+                restarts_left -= 1
+                workers[index] = start_worker()
+        return any(worker.exitcode is None for worker in workers)
+
+    workers = [start_worker() for _ in range(local_workers)]
+    # every file kills at most max_attempts workers, more deaths mean workers can't start at all.
+    restarts_left = local_workers + len(sources) * coordinator.max_attempts
+    with committer:
+        all_compiled = coordinator.run(replace_dead_workers if local_workers else None)
+    for worker in workers:
+        worker.join()
+    for name in written:
+        compare_output(name)
+    return all_compiled
+
+
+def compare_output(name):
+    # Helpful test code
+    outfile = name + ".test.xml"
+    compare_name = name + ".xml"
+    with open(outfile) as my_f, open(compare_name) as compare_f:
+        out_base_name = os.path.basename(outfile)
+        compare_base_name = os.path.basename(compare_name)
+        for index, my_line in enumerate(my_f):
+            compare_line = compare_f.readline()
+            if my_line != compare_line:
+                print("\n" + "*" * 40)
+                print("Comparing {} == {}".format(out_base_name, compare_base_name))
+                print("In {} (line {}): Lines are not equal".format(out_base_name, index))
+                print("Expected line vs. actual was:")
+                print(repr(compare_line))
+                print(repr(my_line))
+        if compare_f.readline():
+            print("File is too short!")
+    # exit("Exiting syntax analyser!!!!!!")
+
+
+def run_benchmark(path, chunk_size, engine, trials, save_path=None, baseline=None, threshold=benchmark.THRESHOLD):
+    """Benchmark compiling the files of `path`, save it as a baseline and/or compare it with `baseline`.
+
+    :returns: False if a phase regressed.
+    """
+
+    sources = [read_source(in_file) for in_file, _ in get_files(path)]
+
+    result = benchmark.run(sources, engine, chunk_size, trials)
+    if save_path:
+        benchmark.save(result, save_path)
+    if baseline is None:
+        for phase in benchmark.PHASES:
+            print("{:<12} {:>10.2f}ms".format(phase, statistics.median(result['samples'][phase]) * 1000))
+        print("peak memory: {:.1f}MiB, throughput: {:.0f} bytes/s".format(
+            result['peak_memory'] / 2 ** 20, result['throughput']))
+        return True
+
+    rows = benchmark.compare(result, baseline, threshold)
+    print(benchmark.report(rows, result, baseline))
+    return not any(row[5] for row in rows)
+
+
+def read_source(in_file):
+    """The text of a source of `get_files()`."""
+    if isinstance(in_file, str):
+        with open(in_file) as in_f:
+            return in_f.read()
+    return in_file.read().decode('utf-8')
+
+
+def source_size(in_file):
+    """The size in bytes of a source of `get_files()`, for an archive member the bytes read from it so far."""
+    if isinstance(in_file, str):
+        return os.path.getsize(in_file)
+    return in_file.tell()
+
+
+def count_files(path):
+    """How many sources `get_files(path)` yields, None for an archive, that would have to be read through."""
+    if is_archive(path):
+        return None
+    return sum(1 for _ in get_files(path))
+
+
+def source_name(in_file, name, path):
+    """The name errors of a source of `get_files(path)` are reported under: its file name, or its path in the archive."""
+    if isinstance(in_file, str):
+        return os.path.basename(in_file)
+    return os.path.relpath(name, os.path.dirname(path)).replace(os.sep, '/') + '.jack'
 
 
 def get_files(path):
+    """Yield the (source, output name without extension) of the .jack files of `path`.
+
+    A source is a path, or for a .zip or .tar(.gz) archive the binary stream
+    of a member, only valid until the next one is asked for. Outputs of
+    members are named by their path in the archive, from the archive's folder.
+    """
     file_type = ".jack"
-    if path.endswith(file_type):
+    if is_archive(path):
+        directory = os.path.dirname(path)
+        for member_name, member_f in archive_sources(path, file_type):
+            yield member_f, os.path.join(directory, *member_name[:-len(file_type)].split('/'))
+    elif path.endswith(file_type):
         # second out arg is file name, with file type removed
         yield path, path.rsplit('.')[0]
     else:
@@ -55,14 +417,165 @@ def get_files(path):
 
 
 if __name__ == "__main__":
-    if len(sys.argv) == 2:
-        path = sys.argv[1]
-    else:
-        path = None
+    arg_parser = argparse.ArgumentParser(description="Generate xml parse trees for .jack files.")
+    arg_parser.add_argument('path', nargs='?',
+                            help="a .jack file, a directory of .jack files or a .zip, .tar or .tar.gz of them")
+    arg_parser.add_argument('--chunk-size', type=int, default=None,
+                            help="stream input in chunks of this many characters (bounded memory)")
+    arg_parser.add_argument('--emit', action='append', choices=sorted(OUTPUT_FORMATS),
+                            help="output format, repeat to write several formats from one parse (default: xml)")
+    arg_parser.add_argument('--jobs', type=int, default=1,
+                            help="parse the subroutines of each class in parallel in this many processes")
+    arg_parser.add_argument('--threads', type=int, default=1,
+                            help="compile this many files at once on a thread pool, in parallel on "
+                                 "free-threaded Python (3.13t+), one at a time where the GIL is on")
+    arg_parser.add_argument('--semantic-check', action='append', choices=SEMANTIC_CHECKS + ('all',),
+                            help="turn on a semantic check, repeat for several")
+    arg_parser.add_argument('--profile', metavar='PREFIX',
+                            help="time every grammar rule of the recursive engine, write PREFIX.collapsed and "
+                                 "PREFIX.speedscope.json")
+    arg_parser.add_argument('--engine', choices=sorted(ENGINES), default='recursive',
+                            help="recursive (default), iterative: explicit stack for deeply nested code, "
+                                 "ll1: table-driven parser built from parser/jack.grammar")
+    arg_parser.add_argument('--source-map', action='store_true',
+                            help="also write the source offsets of every output element to a .test.map file")
+    arg_parser.add_argument('--outline', action='store_true',
+                            help="only parse declarations, skipping subroutine bodies, and write NAME.outline.xml")
+    arg_parser.add_argument('--output-archive', metavar='FILE',
+                            help="write the outputs into a .zip, .tar or .tar.gz FILE instead of next to the sources")
+    arg_parser.add_argument('--check', action='store_true',
+                            help="only check the syntax (and semantic checks), write nothing and exit with "
+                                 "status 1 if a file has errors")
+    arg_parser.add_argument('--diagnostics', metavar='FILE',
+                            help="also write errors to FILE as json lines, with their codes, source spans, "
+                                 "rule paths and expected tokens")
+    arg_parser.add_argument('--max-source-bytes', type=int, help="fail files larger than this")
+    arg_parser.add_argument('--max-tokens', type=int, help="fail files with more tokens than this")
+    arg_parser.add_argument('--max-depth', type=int, help="fail files nested deeper than this many elements")
+    arg_parser.add_argument('--max-seconds', type=float, help="fail files taking longer than this to compile")
+    arg_parser.add_argument('--max-memory', type=int, help="fail files needing more than this many bytes of memory")
+    arg_parser.add_argument('--bench-save', metavar='FILE',
+                            help="benchmark compiling the path and save the results as a baseline")
+    arg_parser.add_argument('--bench-compare', metavar='FILE',
+                            help="benchmark compiling the path and exit with an error if it is slower than "
+                                 "the baseline in FILE")
+    arg_parser.add_argument('--bench-trials', type=int, default=benchmark.TRIALS,
+                            help="timed runs per benchmark (default: %(default)s)")
+    arg_parser.add_argument('--bench-threshold', type=float, default=benchmark.THRESHOLD * 100,
+                            help="percent slowdown tolerated by --bench-compare (default: %(default)s)")
+    arg_parser.add_argument('--service', metavar='ADDRESS',
+                            help="serve json-lines compile requests on HOST:PORT or a Unix socket path, "
+                                 "with a pool of --jobs processes")
+    arg_parser.add_argument('--serve', metavar='ADDRESS',
+                            help="hand the files out to workers connecting to HOST:PORT or a Unix socket path")
+    arg_parser.add_argument('--connect', metavar='ADDRESS',
+                            help="work for the coordinator at ADDRESS instead of compiling a path")
+    arg_parser.add_argument('--local-workers', type=int, default=0,
+                            help="start this many workers on this machine (implies --serve localhost:0)")
+    arg_parser.add_argument('--metrics', metavar='FILE',
+                            help="write live metrics (files, tokens/s, bytes/s, errors, slowest file, memory) to FILE "
+                                 "in the Prometheus text format every --metrics-interval seconds")
+    arg_parser.add_argument('--metrics-interval', type=float, default=METRICS_INTERVAL,
+                            help="seconds between metrics snapshots (default: %(default)s)")
+    arg_parser.add_argument('--progress', action='store_true',
+                            help="show the live metrics as a progress line on stderr")
+    args = arg_parser.parse_args()
+
+    profiler = RuleProfiler() if args.profile else None
+    limits = Limits(args.max_source_bytes, args.max_tokens, args.max_depth, args.max_seconds, args.max_memory) or None
+    checks = args.semantic_check or ()
+    if 'all' in checks:
+        checks = SEMANTIC_CHECKS
+    if checks and args.engine == 'll1':
+        arg_parser.error("the ll1 engine does not do semantic checks")
+    if args.threads > 1 and (args.jobs != 1 or args.max_memory is not None or args.profile):
+        arg_parser.error("--threads can't be used with --jobs, --max-memory (memory is only measured per process) "
+                         "or --profile")
+    if args.threads > 1 and gil_enabled():
+        print("The GIL is enabled, compiling one file at a time instead of on {} threads".format(args.threads),
+              file=sys.stderr)
+    if args.diagnostics and (args.serve or args.local_workers or args.connect or args.service):
+        arg_parser.error("--diagnostics is only written by local compiles")
+    if args.output_archive and (args.check or args.bench_save or args.bench_compare or args.serve or args.local_workers
+                                or args.connect or args.service):
+        arg_parser.error("--output-archive is only written by local compiles")
+    if args.output_archive and not is_archive(args.output_archive):
+        arg_parser.error("--output-archive must end with one of {}".format(', '.join(ARCHIVE_SUFFIXES)))
+    if args.path and is_archive(args.path) and (args.serve or args.local_workers):
+        arg_parser.error("workers are sent sources from a directory, extract the archive first")
+    if args.check and (args.emit or args.source_map or args.outline or args.profile or args.jobs != 1):
+        arg_parser.error("--check writes nothing, it can't be used with --emit, --source-map, --outline, "
+                         "--profile or --jobs")
+    if (args.metrics or args.progress) and (args.bench_save or args.bench_compare or args.serve or args.local_workers
+                                            or args.connect or args.service):
+        arg_parser.error("--metrics and --progress are only reported by local compiles")
+    if args.metrics_interval <= 0:
+        arg_parser.error("--metrics-interval must be positive")
+    if args.jobs != 1 and args.engine != 'recursive' and not args.service:
+        arg_parser.error("--jobs only parses in parallel with the recursive engine")
+    if args.profile and args.engine != 'recursive':
+        arg_parser.error("--profile only times the rules of the recursive engine")
+    if args.outline and (checks or args.source_map or args.engine == 'll1'):
+        arg_parser.error("--outline can't be used with semantic checks, source maps or the ll1 engine")
+
+    # workers authenticate with the shared secret in $JACK_AUTHKEY, local only workers get a random one.
+    authkey = os.environ.get('JACK_AUTHKEY', '').encode()
+    if not authkey and (args.connect or args.serve and not args.local_workers):
+        arg_parser.error("set JACK_AUTHKEY to the secret shared by the coordinator and its workers")
+    if args.connect:
+        compile_source = functools.partial(compile_outputs, chunk_size=args.chunk_size, formats=args.emit or ('xml',),
+                                           checks=checks, engine=args.engine, limits=limits, kill_on_limit=True)
+        run_worker(parse_address(args.connect), authkey, compile_source)
+        exit(0)
+
+    if args.service:
+        service = CompileService(functools.partial(compile_request, limits=limits, kill_on_limit=True), args.jobs)
+        with contextlib.suppress(KeyboardInterrupt):
+            asyncio.run(service.serve_forever(parse_address(args.service)))
+        exit(0)
+
+    if args.path is None:
         print("Expected a file name!")
         exit(0)
 
-    analyze(path)
+    metrics = CompileMetrics(count_files(args.path)) if args.metrics or args.progress else None
+    reporter = contextlib.nullcontext()
+    if metrics is not None:
+        reporter = MetricsReporter(metrics, args.metrics, args.metrics_interval, sys.stderr if args.progress else None)
+
+    if args.check:
+        with open(args.diagnostics, 'w') if args.diagnostics else contextlib.nullcontext() as diagnostics_f, reporter:
+            failed = check(args.path, args.chunk_size, checks, args.engine, limits, diagnostics_f, args.threads,
+                           metrics)
+        if failed:
+            exit(1)
+    elif args.bench_save or args.bench_compare:
+        baseline = None
+        if args.bench_compare:
+            try:
+                baseline = benchmark.load(args.bench_compare)
+            except (OSError, ValueError) as ex:
+                arg_parser.error("Can't use the baseline: {}".format(ex))
+        if not run_benchmark(args.path, args.chunk_size, args.engine, args.bench_trials, args.bench_save, baseline,
+                             args.bench_threshold / 100):
+            exit(1)
+    elif args.serve or args.local_workers:
+        if not analyze_distributed(args.path, parse_address(args.serve or 'localhost:0'), authkey or os.urandom(32),
+                                   args.local_workers, args.chunk_size, args.emit or ('xml',), checks, args.engine,
+                                   limits):
+            exit(1)
+    else:
+        with open(args.diagnostics, 'w') if args.diagnostics else contextlib.nullcontext() as diagnostics_f, reporter:
+            analyze(args.path, args.chunk_size, args.emit or ('xml',), args.jobs, checks, profiler, args.engine,
+                    args.source_map, args.outline, limits, diagnostics_f, args.threads, args.output_archive,
+                    metrics)
+
+    if profiler is not None:
+        with open(args.profile + '.collapsed', 'w') as collapsed_f:
+            profiler.write_collapsed(collapsed_f)
+        with open(args.profile + '.speedscope.json', 'w') as speedscope_f:
+            profiler.write_speedscope(speedscope_f, os.path.basename(args.path))
+        print(profiler.report(20))
 
 
 """